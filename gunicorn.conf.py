@@ -0,0 +1,74 @@
+"""
+Gunicorn settings from the `gunicorn` section of config.yaml, overridable by
+environment variables. Used by the Procfile:
+
+    gunicorn -c gunicorn.conf.py project:app
+
+This file reads config.yaml itself and must not import the project package:
+importing anything under project/ runs create_app (project/__init__.py), which
+would load the app in the master regardless of `preload`. The same settings
+are exposed to the app as SetupConfig.GUNICORN_*; keep the defaults in step.
+
+With `preload: true` (GUNICORN_PRELOAD) the master imports the app once and
+workers share its memory copy-on-write; `post_fork` then gives each worker its
+own DB connections, caches, locks and background threads. With
+`preload: false` the master never imports the app and each worker loads its
+own after the fork.
+
+`worker_class: gthread` with `threads: N` serves N requests per worker at
+once; a thread blocked on Auth0 or PostgreSQL releases the GIL to the
+others. Size database.pool_size + max_overflow and http.pool_size to at
+least N per worker (a warning is logged otherwise), and keep workers x
+(pool_size + max_overflow) below PostgreSQL's max_connections.
+"""
+
+import os
+import sys
+
+import yaml
+
+
+def _load_config():
+    config_yaml = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'config.yaml')
+    if not os.path.isfile(config_yaml):
+        return dict()
+    with open(config_yaml) as f:
+        return (yaml.load(f, Loader=getattr(yaml, 'CSafeLoader', yaml.SafeLoader)) or dict()).get('gunicorn') or dict()
+
+
+def _setting(name, default, env=None):
+    value = os.environ.get(env) if env else None
+    if not value:
+        value = _config.get(name, default)
+    if isinstance(default, bool):
+        return value.lower() in ('1', 'true', 'yes') if isinstance(value, str) else bool(value)
+    return type(default)(value)
+
+
+_config = _load_config()
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+workers = _setting('workers', 2, env='WEB_CONCURRENCY')
+worker_class = _setting('worker_class', 'sync', env='GUNICORN_WORKER_CLASS')
+threads = _setting('threads', 1, env='GUNICORN_THREADS')
+timeout = _setting('timeout', 30)
+preload_app = _setting('preload', True, env='GUNICORN_PRELOAD')
+max_requests = _setting('max_requests', 0)
+max_requests_jitter = _setting('max_requests_jitter', 0)
+
+
+def post_fork(server, worker):
+    if not server.cfg.preload_app:
+        # the worker loads its own app after this hook, nothing to reset
+        return
+    from project.app import after_fork
+    from project.runner import app
+
+    after_fork(app)
+
+
+def worker_exit(server, worker):
+    loggers = sys.modules.get('project.setup.loggers')
+    if loggers is not None:
+        # importing it here would create the app in a worker that never loaded it
+        loggers.log_pipeline.stop()
@@ -1,8 +1,17 @@
+import os
+
+# management commands (db migrate included) always discover models dynamically
+# rather than trusting the model manifest, see project.lib.loaders
+os.environ.setdefault('MODEL_MANIFEST', '0')
+
 from flask_script import Manager
 from flask_migrate import Migrate, MigrateCommand
 
 from project.runner import app
 from project.db import db
+from project.lib.service_tokens import mint_service_token
+from project.lib import benchmarks
+from project.lib.loaders import load_manifest
 
 migrate = Migrate(app, db)
 manager = Manager(app)
@@ -10,5 +19,74 @@ manager = Manager(app)
 manager.add_command('db', MigrateCommand)
 
 
+@manager.option('-s', '--subject', dest='subject', required=True, help='service account subject, i.e. service|batch')
+@manager.option('-p', '--permissions', dest='permissions', default='', help='comma separated permissions')
+@manager.option('-t', '--ttl', dest='ttl', default=None, help='lifetime in seconds')
+@manager.option('-k', '--kid', dest='kid', default=None, help='signing key id, defaults to the first configured key')
+def mint_token(subject, permissions, ttl, kid):
+    """Mint a locally signed service token."""
+    setup = app.config['SETUP']
+    if not setup.SERVICE_TOKEN_ISSUER:
+        raise ValueError('service_tokens.issuer missing from config.yaml')
+    print(mint_service_token(setup.SERVICE_TOKEN_KEYS,
+                             issuer=setup.SERVICE_TOKEN_ISSUER,
+                             audience=setup.AUTH0_API_AUDIENCE,
+                             subject=subject,
+                             permissions=[p for p in permissions.split(',') if p],
+                             ttl=ttl or setup.SERVICE_TOKEN_TTL,
+                             kid=kid,
+                             algorithm=setup.SERVICE_TOKEN_ALGORITHM))
+
+
+def print_results(results):
+    for label, value in results.items():
+        print(f'{label:<48} {value:>12.6f}')
+
+
+@manager.option('-r', '--rows', dest='rows', default=1000, type=int, help='rows per benchmark')
+@manager.option('-b', '--batch-size', dest='batch_size', default=500, type=int, help='rows per batch')
+def bench_bulk(rows, batch_size):
+    """Compare per-row save/delete with the QueryMixin bulk helpers (seconds)."""
+    print_results(benchmarks.bench_bulk(rows=rows, batch_size=batch_size))
+
+
+@manager.option('-c', '--calls', dest='calls', default=2000, type=int, help='calls per measurement')
+def bench_query(calls):
+    """Compare rebuilt filters with the cached statement shapes (microseconds per call)."""
+    print_results(benchmarks.bench_query(calls=calls))
+
+
+@manager.option('-n', '--runs', dest='runs', default=5, type=int, help='interpreter starts per measurement')
+def bench_startup(runs):
+    """Cold start of model loading and create_app (median seconds)."""
+    print_results(benchmarks.bench_startup(runs=runs))
+
+
+@manager.option('-n', '--runs', dest='runs', default=50, type=int, help='loads per measurement')
+def bench_setup(runs):
+    """Configuration load time with and without the setup snapshot (milliseconds)."""
+    print_results(benchmarks.bench_setup(runs=runs))
+
+
+@manager.option('-w', '--workers', dest='workers', default=2, type=int, help='gunicorn workers')
+@manager.option('-t', '--threads', dest='threads', default=8, type=int, help='threads per gthread worker')
+@manager.option('-r', '--requests', dest='requests', default=400, type=int, help='requests per measurement')
+@manager.option('-c', '--concurrency', dest='concurrency', default=32, type=int, help='concurrent clients')
+@manager.option('-l', '--latency', dest='latency', default=50, type=int, help='stub userinfo latency (ms)')
+def bench_serve(workers, threads, requests, concurrency, latency):
+    """Sign in throughput of sync against gthread workers at the same worker count."""
+    print_results(benchmarks.bench_serve(workers=workers, threads=threads, requests=requests,
+                                         concurrency=concurrency, latency=latency))
+
+
+@manager.option('-q', '--quiet', dest='quiet', action='store_true', help='do not list the models')
+def model_manifest(quiet):
+    """Regenerate the model manifest used to load models at startup."""
+    manifest = load_manifest(refresh=True)
+    if not quiet:
+        for mod, name in manifest['models']:
+            print(f'{mod}.{name}')
+
+
 if __name__ == '__main__':
     manager.run()
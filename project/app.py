@@ -4,18 +4,21 @@ https://bobwaycott.com/blog/how-i-use-flask/organizing-flask-models-with-automat
 https://blog.miguelgrinberg.com/post/the-flask-mega-tutorial-part-i-hello-world
 """
 
-from copy import deepcopy
 from flask import Flask
 from flask_cors import CORS
 from flask_wtf import CSRFProtect
 from flask_login import LoginManager
 
 
-from project.setup import SetupConfig
-from project.setup.loggers import LOGGERS
-from project.db import db, init_db
+from project.setup import load_setup
+from project.setup.loggers import LOGGERS, log_pipeline
+from project.db import db, init_db, dispose_engines
+from project.lib.metrics import metrics
+from project.models.mixins import query
+from project.models.mixins.query import result_cache
 
-from project.auth import login_manager
+from project.auth import login_manager, http_client, jwks_store, token_cache, userinfo_synced, userinfo_seen, \
+    user_cache, init_auth_metrics, reset_auth_after_fork
 from project.routes import init_routes
 
 
@@ -37,22 +40,32 @@ def create_app(config_yaml=None):
     Raises EnvironmentError if config_file cannot be found.
     """
 
-    setup = SetupConfig(config_yaml=config_yaml)
+    setup = load_setup(config_yaml=config_yaml)
 
     # start app setup
     app = Flask(__name__, template_folder=setup.TEMPLATES, static_folder=setup.STATIC_FILES)
     CORS(app)
-    app.config['SETUP'] = deepcopy(setup)
-    app.config['SECRET_KEY'] = deepcopy(setup.SECRET_KEY)
+    app.config['SETUP'] = setup
+    app.config['SECRET_KEY'] = setup.SECRET_KEY
 
     set_app_mode(app)
     login_manager.init_app(app)
+    http_client.init_app(app)
+    jwks_store.init_app(app)
+    token_cache.configure(maxsize=setup.AUTH_TOKEN_CACHE_SIZE, ttl=setup.AUTH_TOKEN_CACHE_TTL)
+    userinfo_synced.configure(ttl=setup.AUTH0_USERINFO_FRESHNESS)
+    userinfo_seen.configure(ttl=setup.AUTH0_USERINFO_STALE)
+    user_cache.configure(maxsize=setup.AUTH_USER_CACHE_SIZE, ttl=setup.AUTH_USER_CACHE_TTL)
+    init_auth_metrics(app)
+    metrics.register_gauge('log.pipeline', lambda: log_pipeline.stats)
     # setup csrf
     if not app.testing:
         csrf.init_app(app)
 
     # setup db
     init_db(app, db)
+    result_cache.configure(maxsize=setup.DATABASE_RESULT_CACHE_SIZE, ttl=setup.DATABASE_RESULT_CACHE_TTL,
+                           maxbytes=setup.DATABASE_RESULT_CACHE_BYTES)
 
     # todo: remove these two lines and replace with migrate
     #db.drop_all()
@@ -64,6 +77,29 @@ def create_app(config_yaml=None):
     return app
 
 
+def after_fork(app):
+    """Make a worker forked from a preloaded app safe to serve requests.
+
+    Usage (gunicorn.conf.py):
+        def post_fork(server, worker):
+            after_fork(app)
+
+    The parent's pooled DB connections are dropped (not closed) so the worker
+    opens its own, and every per-process cache, lock and background thread
+    created by create_app, including the log listeners, is replaced with a
+    fresh one.
+    """
+    from project.models import user
+
+    log_pipeline.after_fork()
+    dispose_engines(app)
+    reset_auth_after_fork()
+    query.reset_after_fork()
+    user.reset_after_fork()
+    metrics.after_fork()
+    LOGGERS.WebApp.debug('after_fork: per-worker state re-initialized')
+
+
 def set_app_mode(app):
     # set some helpful attrs to greatly simplify state checks
     setup = app.config['SETUP']
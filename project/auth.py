@@ -1,16 +1,38 @@
-import json
-from urllib.request import urlopen, Request
-from flask import request, current_app
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from hashlib import sha256
+from flask import request, current_app, g, has_request_context
 from flask_login import LoginManager, current_user, login_user, logout_user
 from functools import wraps
 from jose import jwt
-from urllib.request import urlopen
+from arrow import Arrow, get as arrow_get
 
-from project.setup.loggers import LOGGERS
+from project.setup.loggers import LOGGERS, LazyJson
+from project.lib.http_client import HttpClient, HttpError
+from project.lib.jwks import JwksKeyStore
+from project.lib.cache import LRUCache
+from project.lib.metrics import metrics
+from project.lib.resilience import Deadline
+from project.lib.service_tokens import decode_service_token, ServiceTokenError
 
+from project.db import db
 from project.models.user import UserProfile
 
 login_manager = LoginManager()
+# every outbound auth call shares one keep-alive connection pool
+http_client = HttpClient()
+jwks_store = JwksKeyStore(client=http_client)
+# verified payloads keyed by token digest, never kept past the token's exp
+token_cache = LRUCache()
+# subjects whose userinfo was synced within AUTH0_USERINFO_FRESHNESS
+userinfo_synced = LRUCache()
+# subjects synced within AUTH0_USERINFO_STALE, revalidated off the request thread
+userinfo_seen = LRUCache()
+userinfo_refresher = ThreadPoolExecutor(max_workers=2, thread_name_prefix='userinfo-refresh')
+# column values of recently loaded session users, keyed by profile id
+user_cache = LRUCache()
 
 log = LOGGERS.Auth
 
@@ -27,37 +49,152 @@ class AuthError(Exception):
 
 @login_manager.user_loader
 def load_user(profile_id):
-    return UserProfile.get(profile_id)
+    """
+    Load the session user, from user_cache when possible.
+    Cached rows are re-attached to the session without a SELECT.
+    """
+    row = user_cache.get(str(profile_id))
+    if row is not None:
+        return UserProfile.from_row(row)
+    user = UserProfile.get(profile_id)
+    if user is not None:
+        user_cache.set(str(profile_id), user.to_row())
+    return user
+
+
+@UserProfile.on_write
+def invalidate_user(model, identity):
+    if identity:
+        user_cache.pop(str(identity[0]))
+    else:
+        user_cache.clear()
 
 
 def verify_user(payload):
+    """
+    Resolve the UserProfile for a verified payload.
+
+    Userinfo is fetched from the `https` audiences at most once per subject per
+    AUTH0_USERINFO_FRESHNESS seconds, and the profile is only written when a
+    field actually changed. Subjects synced within AUTH0_USERINFO_STALE are
+    served from the stored profile while userinfo is revalidated in the
+    background; if a blocking fetch fails the stored profile is served as is.
+    :param payload: decoded jwt payload annotated with its 'token'
+    :return: UserProfile
+    """
     token = payload.get('token')
     sub = payload.get('sub')
-    profile = UserProfile.get_or_create(sub)
+    with timed('profile_get'):
+        profile = UserProfile.get_or_create(sub)
+    if userinfo_synced.get(sub):
+        return profile
 
-    # get latest user info from payload
+    # get latest user info from payload, fetching every userinfo audience at once
     aud = payload.get('aud', [])
-    user_info = dict()
-    for item in aud:
-        if 'https' in item:
-            req = Request(item)
-            req.add_header('Authorization', f"Bearer {token}")
-            content = urlopen(req).read()
-            info = json.loads(content)
-            user_info[item] = info
-            LOGGERS.Login.debug(json.dumps(user_info, indent=4))
-    # update user info from payload
-    for info in user_info.values():
-        for key, value in info.items():
-            if hasattr(profile, key):
-                if getattr(profile, key) != value:
-                    setattr(profile, key, value)
-    # save changes
-    profile.save()
-    LOGGERS.Login.debug(json.dumps(profile.dictionary, indent=4))
+    if isinstance(aud, str):
+        aud = [aud]
+    urls = _userinfo_urls(aud)
+    if not urls:
+        userinfo_synced.set(sub, True)
+        return profile
+    if userinfo_seen.get(sub):
+        # stale while revalidate, marking fresh first so only one refresh is queued
+        userinfo_synced.set(sub, True)
+        userinfo_refresher.submit(_refresh_userinfo, current_app._get_current_object(), sub, urls, token)
+        return profile
+    try:
+        timeout = budget_timeout()
+    except AuthError as e:
+        log.warning('userinfo fetch skipped, serving stored profile: %s', e.message)
+        return profile
+    try:
+        with timed('userinfo'):
+            user_info = _fetch_userinfo(urls, token, timeout=timeout)
+    except HttpError as e:
+        log.warning('userinfo fetch failed, serving stored profile: %s', e)
+        return profile
+    _apply_userinfo(profile, user_info)
     return profile
 
 
+def _userinfo_urls(aud):
+    # https audiences (Auth0's /userinfo) plus any listed in AUTH0_USERINFO_URLS
+    listed = current_app.config['SETUP'].AUTH0_USERINFO_URLS
+    return [item for item in aud if 'https' in item or item in listed]
+
+
+def _fetch_userinfo(urls, token, timeout=None):
+    user_info = http_client.get_json_many(urls, headers={'Authorization': f"Bearer {token}"}, timeout=timeout)
+    LOGGERS.Login.debug(LazyJson(user_info))
+    return user_info
+
+
+def _apply_userinfo(profile, user_info):
+    # update user info from payload, saving only real changes
+    if sync_profile(profile, user_info.values()):
+        with timed('profile_save'):
+            profile.save()
+        if LOGGERS.Login.isEnabledFor(logging.DEBUG):
+            LOGGERS.Login.debug(LazyJson(profile.dictionary))
+    userinfo_synced.set(profile.alternate_id, True)
+    userinfo_seen.set(profile.alternate_id, True)
+
+
+def _refresh_userinfo(app, sub, urls, token):
+    """Background revalidation of a stale profile, see verify_user."""
+    with app.app_context():
+        try:
+            user_info = _fetch_userinfo(urls, token)
+            profile = UserProfile.first(alternate_id=sub)
+            if profile is not None:
+                _apply_userinfo(profile, user_info)
+        except Exception as e:
+            log.warning('userinfo background refresh failed for %s: %s', sub, e)
+            userinfo_synced.pop(sub)
+        finally:
+            db.session.remove()
+
+
+def budget_timeout():
+    """
+    HTTP timeouts clipped to what is left of the request's AUTH_LATENCY_BUDGET.
+    :return: (connect, read) tuple, or None outside of a request
+    Raises AuthError once the budget is spent.
+    """
+    if not has_request_context():
+        return None
+    remaining = get_auth_context().deadline.remaining
+    if remaining <= 0:
+        raise AuthError('Authentication latency budget exceeded.', 503)
+    return http_client.timeout(within=remaining)
+
+
+def sync_profile(profile, infos):
+    """
+    Copy userinfo fields onto a profile.
+    :param profile: UserProfile
+    :param infos: iterable of userinfo dictionaries
+    :return: True if any attribute changed
+    """
+    changed = False
+    for info in infos:
+        for key, value in info.items():
+            if hasattr(profile, key) and _differs(getattr(profile, key), value):
+                setattr(profile, key, value)
+                changed = True
+    return changed
+
+
+def _differs(current, value):
+    # ArrowType columns hold Arrow objects while userinfo carries ISO strings
+    if isinstance(current, Arrow) and value is not None:
+        try:
+            return current != arrow_get(value)
+        except (TypeError, ValueError):
+            return True
+    return current != value
+
+
 def get_token_auth_header():
     """
     Obtains the Access Token from the Authorization Header
@@ -69,7 +206,7 @@ def get_token_auth_header():
 
     # it should attempt to get the header from the request
     auth = request.headers.get('Authorization', None)
-    log.debug(f'get_token_auth_header, got: {auth}')
+    log.debug('get_token_auth_header, got: %s', auth)
     #   -> raise an AuthError if no header is present
     if not auth:
         raise AuthError('authorization_header_missing', 401)
@@ -118,54 +255,74 @@ def check_permissions(permission, payload):
 def verify_decode_jwt(token):
     """
     Verifies that the token in the Authorization header is valid.
+    Tokens already verified by this process are served from token_cache
+    until their exp, skipping the signature check.
     :param token: a json web token (string)
     :return: payload: decoded token dictionary
+    """
+    digest = sha256(token.encode('utf-8')).hexdigest()
+    payload = token_cache.get(digest)
+    if payload is None:
+        payload = _verify_decode_jwt(token)
+        token_cache.set(digest, payload, expires_at=payload.get('exp'))
+    # callers annotate the payload, keep the cached copy pristine
+    return dict(payload)
 
-    !!NOTE urlopen has a common certificate error described here:
-    https://stackoverflow.com/questions/50236117/scraping-ssl-certificate-verify-failed-error-for-http-en-wikipedia-org
+
+def _verify_decode_jwt(token):
+    """
+    Verifies the token signature and claims, without consulting token_cache.
+    The issuer claim selects the verifier: tokens from SERVICE_TOKEN_ISSUER are
+    checked against locally held keys, everything else goes to Auth0.
+    Signing keys come from the in-process jwks_store rather than a fetch per call.
+    :param token: a json web token (string)
+    :return: payload: decoded token dictionary
 
     ** NOTE **
     Largely copied from practice exercises in course lessons.
     """
 
+    log.debug('token: %s', token)
+    setup = current_app.config['SETUP']
+    try:
+        issuer = jwt.get_unverified_claims(token).get('iss')
+    except jwt.JWTError as e:
+        raise AuthError('Authorization malformed, Error decoding token claims.', 401)
+    if setup.SERVICE_TOKEN_ISSUER and issuer == setup.SERVICE_TOKEN_ISSUER:
+        return _verify_service_token(token, setup)
+
     # it should verify the token using Auth0 /.well-known/jwks.json
-    log.debug(f'token: {token}')
     if not current_app.testing:
-        jsonurl = urlopen(f'https://{current_app.config["SETUP"].AUTH0_DOMAIN}/.well-known/jwks.json')
-        jwks = json.loads(jsonurl.read())
         try:
             unverified_header = jwt.get_unverified_header(token)
         except jwt.JWTError as e:
             raise AuthError('Authorization malformed, Error decoding token headers.', 401)
-        rsa_key = ''
         # it should be an Auth0 token with key id (kid)
-        log.debug(json.dumps(unverified_header, indent=4))
+        log.debug(LazyJson(unverified_header))
         if 'kid' not in unverified_header:
             raise AuthError('Authorization malformed.', 401)
 
-        for key in jwks['keys']:
-            if key['kid'] == unverified_header['kid']:
-                rsa_key = {
-                    'kty': key['kty'],
-                    'kid': key['kid'],
-                    'use': key['use'],
-                    'n': key['n'],
-                    'e': key['e']
-                }
+        try:
+            with timed('jwks'):
+                rsa_key = jwks_store.get_key(unverified_header['kid'], timeout=budget_timeout())
+        except HttpError as e:
+            log.warning('JWKS fetch failed: %s', e)
+            raise AuthError('Unable to fetch signing keys.', 503)
 
         if rsa_key:
             # it should decode the payload from the token
             # it should validate the claims (which a lack of exceptions indicates)
             try:
-                payload = jwt.decode(
-                    token,
-                    rsa_key,
-                    algorithms=current_app.config["SETUP"].AUTH0_ALGORITHMS,
-                    audience=current_app.config["SETUP"].AUTH0_API_AUDIENCE,
-                    issuer='https://' + current_app.config["SETUP"].AUTH0_DOMAIN + '/'
-                )
+                with timed('signature'):
+                    payload = jwt.decode(
+                        token,
+                        rsa_key,
+                        algorithms=current_app.config["SETUP"].AUTH0_ALGORITHMS,
+                        audience=current_app.config["SETUP"].AUTH0_API_AUDIENCE,
+                        issuer='https://' + current_app.config["SETUP"].AUTH0_DOMAIN + '/'
+                    )
                 # return the decoded payload
-                log.debug(json.dumps(payload, indent=4))
+                log.debug(LazyJson(payload))
                 return payload
             except jwt.ExpiredSignatureError:
                 raise AuthError('Token expired.', 401)
@@ -178,11 +335,196 @@ def verify_decode_jwt(token):
         secret = current_app.config['SETUP'].JWT_SECRET
         algorithm = current_app.config['SETUP'].AUTH0_ALGORITHMS[0]
         audience = current_app.config['SETUP'].AUTH0_API_AUDIENCE
-        payload = jwt.decode(token, secret, algorithms=algorithm, audience=audience)
-        log.debug(json.dumps(payload, indent=4))
+        with timed('signature'):
+            payload = jwt.decode(token, secret, algorithms=algorithm, audience=audience)
+        log.debug(LazyJson(payload))
         return payload
 
 
+def _verify_service_token(token, setup):
+    """
+    Verifies a locally signed service token, no network round trip involved.
+    :param token: a json web token (string)
+    :param setup: SetupConfig
+    :return: payload: decoded token dictionary
+    """
+    try:
+        with timed('signature'):
+            payload = decode_service_token(token,
+                                           keys=setup.SERVICE_TOKEN_KEYS,
+                                           issuer=setup.SERVICE_TOKEN_ISSUER,
+                                           audience=setup.AUTH0_API_AUDIENCE,
+                                           algorithm=setup.SERVICE_TOKEN_ALGORITHM)
+    except ServiceTokenError as e:
+        raise AuthError(e.message, 401)
+    except jwt.ExpiredSignatureError:
+        raise AuthError('Token expired.', 401)
+    except jwt.JWTClaimsError:
+        raise AuthError('Incorrect claims. Please, check the audience and issuer.', 401)
+    except jwt.JWTError:
+        raise AuthError('Unable to parse authentication token.', 400)
+    log.debug(LazyJson(payload))
+    return payload
+
+
+class AuthContext(object):
+    """
+    The auth pipeline for one request:
+        header parse -> verify -> permission set -> user
+    Each stage runs at most once; its result, or the AuthError it raised, is
+    kept and replayed to every later caller in the same request.
+    `timings` holds the seconds spent in each stage that ran and `deadline`
+    what is left of the latency budget for outbound calls.
+    """
+
+    def __init__(self, budget):
+        self.timings = dict()
+        self.deadline = Deadline(budget)
+        self._results = dict()
+
+    @property
+    def token(self):
+        return self._run('header', get_token_auth_header)
+
+    @property
+    def payload(self):
+        token = self.token
+
+        def verify():
+            payload = verify_decode_jwt(token)
+            payload['token'] = token
+            return payload
+        return self._run('verify', verify)
+
+    @property
+    def permissions(self):
+        payload = self.payload
+
+        def permission_set():
+            if 'permissions' not in payload:
+                raise AuthError('Permissions not included in JWT.', 400)
+            return frozenset(payload['permissions'])
+        return self._run('permissions', permission_set)
+
+    @property
+    def user(self):
+        payload = self.payload
+        return self._run('user', lambda: verify_user(payload))
+
+    def check_permission(self, permission):
+        """
+        Same contract as check_permissions, against the cached permission set.
+        :return: the verified payload
+        """
+        if permission not in self.permissions:
+            raise AuthError('Permission not found.', 401)
+        return self.payload
+
+    def sign_in(self, always=False):
+        """
+        Bind the verified user to the flask_login session.
+        :param always: call login_user even when the session already holds this user
+        :return: UserProfile
+        """
+        user = self.user
+        if current_user.is_anonymous:
+            log.debug('signing in user: %s', user.alternate_id)
+            login_user(user)
+        elif current_user.alternate_id != user.alternate_id:
+            raise AuthError('Session already bound to different user credentials.', 401)
+        elif always:
+            login_user(user)
+        return user
+
+    @contextmanager
+    def stage(self, name):
+        """Accumulate the time spent inside the block under `name`, and
+        observe it in the `auth.<name>` histogram."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.timings[name] = self.timings.get(name, 0.0) + elapsed
+            metrics.observe(f'auth.{name}', elapsed)
+
+    @property
+    def server_timing(self):
+        """Render `timings` as a Server-Timing header value (milliseconds)."""
+        return ', '.join(f'auth-{name};dur={seconds * 1000:.2f}' for name, seconds in self.timings.items())
+
+    ########################################
+    # Internal methods; Do not use directly
+    ########################################
+    def _run(self, name, func):
+        if name not in self._results:
+            with self.stage(name):
+                try:
+                    self._results[name] = (func(), None)
+                except AuthError as e:
+                    self._results[name] = (None, e)
+        result, error = self._results[name]
+        if error is not None:
+            raise error
+        return result
+
+
+def get_auth_context():
+    """
+    Return the AuthContext of the current request, creating it on first use.
+    """
+    if 'auth_context' not in g:
+        g.auth_context = AuthContext(current_app.config['SETUP'].AUTH_LATENCY_BUDGET)
+    return g.auth_context
+
+
+def timed(name):
+    """
+    Time a block as stage `name` of the current request's AuthContext, or
+    straight into the `auth.<name>` histogram outside of a request.
+    """
+    if has_request_context():
+        return get_auth_context().stage(name)
+    return metrics.timer(f'auth.{name}')
+
+
+def init_auth_metrics(app):
+    """
+    Publish auth cache and key store state to the metrics registry and, when
+    METRICS_SERVER_TIMING is enabled, add a Server-Timing header to responses.
+    """
+    metrics.register_gauge('auth.token_cache', lambda: token_cache.stats)
+    metrics.register_gauge('auth.userinfo_synced', lambda: userinfo_synced.stats)
+    metrics.register_gauge('auth.user_cache', lambda: user_cache.stats)
+    metrics.register_gauge('auth.jwks_keys', lambda: len(jwks_store.keys))
+    metrics.register_gauge('auth.userinfo_seen', lambda: userinfo_seen.stats)
+    metrics.register_gauge('http.breakers', lambda: http_client.breakers)
+
+    if app.config['SETUP'].METRICS_SERVER_TIMING:
+        @app.after_request
+        def add_server_timing(response):
+            auth_context = g.get('auth_context')
+            if auth_context is not None and auth_context.timings:
+                timing = auth_context.server_timing
+                if response.headers.get('Server-Timing'):
+                    timing = f"{response.headers['Server-Timing']}, {timing}"
+                response.headers['Server-Timing'] = timing
+            return response
+
+
+def reset_auth_after_fork():
+    """
+    Re-initialize per-process auth state in a worker forked from a preloaded
+    app: caches, locks, HTTP connections and background threads.
+    """
+    global userinfo_refresher
+    userinfo_refresher = ThreadPoolExecutor(max_workers=2, thread_name_prefix='userinfo-refresh')
+    http_client.after_fork()
+    jwks_store.after_fork()
+    for cache in (token_cache, userinfo_synced, userinfo_seen, user_cache):
+        cache.after_fork()
+
+
 def view_requires_sign_in(f):
     """
     Decorator to require Authorization for a given route without any specific permissions
@@ -191,15 +533,7 @@ def view_requires_sign_in(f):
     """
     @wraps(f)
     def wrapper(self, *args, **kwargs):
-        token = get_token_auth_header()
-        payload = verify_decode_jwt(token)
-        payload['token'] = token
-        user = verify_user(payload)
-        if current_user.is_anonymous:
-            log.debug(f'signing in user: {user.alternate_id}')
-            login_user(user)
-        elif current_user.alternate_id != user.alternate_id:
-            raise AuthError('Session already bound to different user credentials.', 401)
+        user = get_auth_context().sign_in()
         # self is a FlaskView object
         return f(self, user, *args, **kwargs)
     return wrapper
@@ -214,15 +548,7 @@ def view_changes_if_signed_in(f):
     @wraps(f)
     def wrapper(self, *args, **kwargs):
         try:
-            token = get_token_auth_header()
-            payload = verify_decode_jwt(token)
-            payload['token'] = token
-            user = verify_user(payload)
-            if current_user.is_anonymous:
-                log.debug(f'signing in user: {user.alternate_id}')
-                login_user(user)
-            elif current_user.alternate_id != user.alternate_id:
-                raise AuthError('Session already bound to different user credentials.', 401)
+            user = get_auth_context().sign_in()
         except AuthError as e:
             user = None
         # self is a FlaskView object
@@ -239,13 +565,8 @@ def view_requires_auth(permission=''):
     def requires_auth_decorator(f):
         @wraps(f)
         def wrapper(self, *args, **kwargs):
-            # it should use the get_token_auth_header method to get the token
-            token = get_token_auth_header()
-            # it should use the verify_decode_jwt method to decode the jwt
-            payload = verify_decode_jwt(token)
-            # it should use the check_permissions method validate claims and check the requested permission
-            payload['token'] = token
-            check_permissions(permission, payload)
+            # the request's auth context parses the header, decodes the jwt and checks the permission
+            payload = get_auth_context().check_permission(permission)
             # self is a FlaskView object
             return f(self, payload, *args, **kwargs)
         return wrapper
@@ -261,14 +582,6 @@ def requires_sign_in(f):
     """
     @wraps(f)
     def wrapper(*args, **kwargs):
-        token = get_token_auth_header()
-        payload = verify_decode_jwt(token)
-        payload['token'] = token
-        user = verify_user(payload)
-        if current_user.is_anonymous:
-            log.debug(f'signing in user: {user.alternate_id}')
-        elif current_user.alternate_id != user.alternate_id:
-            raise AuthError('Session already bound to different user credentials.', 401)
-        login_user(user)
+        user = get_auth_context().sign_in(always=True)
         return f(user, *args, **kwargs)
     return wrapper
@@ -7,24 +7,81 @@ https://blog.miguelgrinberg.com/post/the-flask-mega-tutorial-part-i-hello-world
 """
 
 
+import random
+
 from flask import Flask
-from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy import SQLAlchemy, SignallingSession
 from flask_migrate import Migrate
+from sqlalchemy import orm
 from sqlalchemy_utils import force_auto_coercion
 
 
 from project.setup.loggers import LOGGERS
 from project.lib.loaders import load_models
+from project.lib.metrics import metrics
+from project.lib.pool import InstrumentedQueuePool, pool_stats
+from project.lib.sql_profiler import SqlProfiler
 
-__all__ = ('db', 'init_db')
+__all__ = ('db', 'init_db', 'engine_options', 'REPLICA_OPTION', 'use_primary', 'sql_profiler', 'dispose_engines')
 
 log = LOGGERS.Setup
+
+# execution option marking a statement as safe to run on a read replica
+REPLICA_OPTION = 'read_replica'
+# session.info flag: the session has written, so it reads from the primary from now on
+_PRIMARY_KEY = 'use_primary'
+
+
+class RoutingSession(SignallingSession):
+    """SignallingSession sending statements marked with the REPLICA_OPTION
+    execution option to a random read replica bind, until the session first
+    writes (flushes or executes DML). Everything else uses the primary.
+    """
+
+    def __init__(self, db, **options):
+        self._db = db
+        super().__init__(db, **options)
+
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        if self._flushing or (clause is not None and clause.is_dml):
+            self.info[_PRIMARY_KEY] = True
+        replicas = self.app.config.get('DATABASE_REPLICA_BINDS')
+        if replicas and clause is not None and not self.info.get(_PRIMARY_KEY) \
+                and clause.get_execution_options().get(REPLICA_OPTION):
+            return self._db.get_engine(self.app, bind=random.choice(replicas))
+        return super().get_bind(mapper, clause)
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+    """SQLAlchemy whose sessions are RoutingSessions, and whose engines (the
+    primary and every replica bind) get the engine_options of their own URL.
+    """
+
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+    def apply_driver_hacks(self, app, sa_url, options):
+        sa_url, options = super().apply_driver_hacks(app, sa_url, options)
+        options.update(engine_options(app.config['SETUP'], str(sa_url)))
+        return sa_url, options
+
+
+def use_primary(session=None):
+    """Send every later read of `session` (default: the current request's
+    session) to the primary, e.g. after writing outside the session.
+    """
+    session = session or db.session()
+    session.info[_PRIMARY_KEY] = True
+
+
 # our global DB object (imported by models & views & everything else)
-db = SQLAlchemy()
+db = RoutingSQLAlchemy()
 # support importing a functioning session query
 query = db.session.query
 # our global migrate object
 migrate = Migrate()
+# per request statement timing, see project.lib.sql_profiler
+sql_profiler = SqlProfiler()
 
 
 def init_db(app=None, db=None):
@@ -37,16 +94,64 @@ def init_db(app=None, db=None):
     """
     if isinstance(app, Flask) and isinstance(db, SQLAlchemy):
         force_auto_coercion()
-        load_models()
+        load_models(use_manifest=app.config['SETUP'].MODEL_MANIFEST)
         database_url = app.config['SETUP'].DATABASE_URL
         app.config["SQLALCHEMY_DATABASE_URI"] = database_url
 
         app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+        # pool and connect options are set per bind URL, see RoutingSQLAlchemy
+        replicas = {f'replica_{index}': url for index, url in enumerate(app.config['SETUP'].DATABASE_REPLICA_URLS)}
+        app.config["SQLALCHEMY_BINDS"] = replicas
+        app.config["DATABASE_REPLICA_BINDS"] = list(replicas)
+        if replicas:
+            log.info('Routing reads to %d read replica(s).', len(replicas))
         db.app = app
         db.init_app(app)
+        metrics.register_gauge('db.pool', lambda: pool_stats(db.engine.pool))
+        if replicas:
+            metrics.register_gauge('db.replica_pools', lambda: {
+                bind: pool_stats(db.get_engine(app, bind=bind).pool) for bind in replicas
+            })
+        sql_profiler.init_app(app)
         # migrate.init_app(app, db)
         log.info(f'Database Successfully configured.')
     else:
         raise ValueError('Cannot init DB without db and app objects.')
 
 
+def dispose_engines(app):
+    """
+    Discard the pooled connections a forked worker inherited from its parent
+    without closing them (the parent still owns the sockets), so the worker
+    opens its own.
+    """
+    with app.app_context():
+        for bind in [None] + list(app.config.get('DATABASE_REPLICA_BINDS', ())):
+            db.get_engine(app, bind=bind).dispose(close=False)
+
+
+def engine_options(setup, url=None):
+    """
+    Returns the SQLAlchemy create_engine keyword arguments for `url`, by
+    default the configured DATABASE_URL. Pool sizing only applies to pooled
+    (non sqlite) databases, the statement timeout only to PostgreSQL.
+    """
+    url = url or setup.DATABASE_URL
+    options = {
+        'pool_pre_ping': setup.DATABASE_POOL_PRE_PING,
+        'pool_recycle': setup.DATABASE_POOL_RECYCLE,
+    }
+    if not url.startswith('sqlite'):
+        if setup.DATABASE_POOL_SIZE + setup.DATABASE_MAX_OVERFLOW < setup.GUNICORN_THREADS:
+            log.warning('DATABASE_POOL_SIZE + DATABASE_MAX_OVERFLOW is below GUNICORN_THREADS (%d): '
+                        'request threads will queue for connections', setup.GUNICORN_THREADS)
+        options.update({
+            'poolclass': InstrumentedQueuePool,
+            'pool_size': setup.DATABASE_POOL_SIZE,
+            'max_overflow': setup.DATABASE_MAX_OVERFLOW,
+            'pool_timeout': setup.DATABASE_POOL_TIMEOUT,
+        })
+    if url.startswith('postgres') and setup.DATABASE_STATEMENT_TIMEOUT:
+        options['connect_args'] = {'options': f'-c statement_timeout={setup.DATABASE_STATEMENT_TIMEOUT}'}
+    log.debug('SQLALCHEMY_ENGINE_OPTIONS: %s', options)
+    return options
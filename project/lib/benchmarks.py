@@ -0,0 +1,260 @@
+"""
+Micro benchmarks run through manage.py, i.e.:
+
+    python manage.py bench_bulk --rows 2000
+    python manage.py bench_query --calls 5000
+    python manage.py bench_startup --runs 5
+    python manage.py bench_setup --runs 50
+    python manage.py bench_serve --workers 2 --threads 8
+
+Each benchmark returns a dict of label => seconds (or per-call microseconds)
+so results can be compared between commits. Benchmarks that write only touch
+rows whose alternate_id starts with BENCH_PREFIX.
+"""
+
+import json
+import os
+import secrets
+import socket
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from copy import deepcopy
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.error import URLError
+from urllib.request import Request, urlopen
+
+from project.db import db
+from project.lib.service_tokens import mint_service_token
+
+
+__all__ = ('bench_bulk', 'bench_query', 'bench_startup', 'bench_setup', 'bench_serve', )
+
+
+BENCH_PREFIX = 'bench|'
+
+
+@contextmanager
+def stopwatch(results, label):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        results[label] = time.perf_counter() - start
+
+
+def _bench_rows(rows, offset=0):
+    return [{'alternate_id': f'{BENCH_PREFIX}{offset + i}', 'locale': 'en'} for i in range(rows)]
+
+
+def bench_bulk(rows=1000, batch_size=500):
+    """Per-row save/delete against bulk_insert, bulk_upsert and bulk_delete."""
+    from project.models.user import UserProfile
+
+    results = dict()
+    prefix = UserProfile.alternate_id.startswith(BENCH_PREFIX)
+    db.session.query(UserProfile).filter(prefix).delete(synchronize_session=False)
+    db.session.commit()
+
+    with stopwatch(results, f'per-row save x{rows}'):
+        for row in _bench_rows(rows):
+            UserProfile(**row).save()
+    with stopwatch(results, f'per-row delete x{rows}'):
+        for profile in UserProfile.query.filter(prefix).all():
+            profile.delete()
+
+    with stopwatch(results, f'bulk_insert x{rows}'):
+        UserProfile.bulk_insert(_bench_rows(rows), batch_size=batch_size)
+    upserts = _bench_rows(rows, offset=rows // 2)
+    for row in upserts:
+        row['nickname'] = 'upserted'
+    with stopwatch(results, f'bulk_upsert x{rows} (half conflicting)'):
+        UserProfile.bulk_upsert(upserts, key='alternate_id', batch_size=batch_size)
+    with stopwatch(results, f'bulk_delete x{rows + rows // 2}'):
+        UserProfile.bulk_delete(prefix, batch_size=batch_size)
+    return results
+
+
+def bench_query(calls=2000):
+    """Per-call microseconds of a filtered `first()` and of building its
+    query, with filters rebuilt on every call against the cached statement
+    shapes of QueryMixin._and_query. The result cache is not involved.
+    """
+    from project.models.user import UserProfile
+
+    results = dict()
+    kwargs = {'alternate_id': f'{BENCH_PREFIX}query', 'locale': 'en'}
+    if not UserProfile.exists(**kwargs):
+        UserProfile(**kwargs).save()
+
+    def rebuilt():
+        return UserProfile.query.filter(db.and_(*UserProfile._filters(kwargs)))
+
+    def shaped():
+        return UserProfile._and_query(kwargs)
+
+    for label, build in (('rebuilt filters', rebuilt), ('cached shape', shaped)):
+        build().first()  # warm the compiled statement cache
+        with stopwatch(results, f'{label}: build query (us/call)'):
+            for _ in range(calls):
+                build()
+        with stopwatch(results, f'{label}: build + first() (us/call)'):
+            for _ in range(calls):
+                build().first()
+    UserProfile.bulk_delete(UserProfile.alternate_id.startswith(BENCH_PREFIX))
+    return {label: seconds * 1e6 / calls for label, seconds in results.items()}
+
+
+def bench_startup(runs=5):
+    """Median cold start seconds of a worker importing the app (which runs
+    create_app), with models found by dynamic discovery and through the
+    model manifest. Each run is a new interpreter, as a gunicorn worker
+    would be; interpreter start up itself is excluded.
+    """
+    from project.lib.loaders import load_manifest
+
+    load_manifest(refresh=True)
+    root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    code = ('import time\n'
+            'start = time.perf_counter()\n'
+            'import project\n'
+            'print(time.perf_counter() - start)')
+    results = dict()
+    for label, use_manifest in (('create_app (dynamic discovery)', '0'), ('create_app (model manifest)', '1')):
+        env = dict(os.environ, PYTHONPATH=root, MODEL_MANIFEST=use_manifest)
+        samples = sorted(
+            float(subprocess.run([sys.executable, '-c', code], cwd=root, env=env, check=True,
+                                 stdout=subprocess.PIPE, stderr=subprocess.DEVNULL).stdout.split()[-1])
+            for _ in range(runs))
+        results[label] = samples[len(samples) // 2]
+    return results
+
+
+def bench_setup(runs=50):
+    """Milliseconds per configuration load: SetupConfig plus the deepcopy
+    create_app used to make, against load_setup with and without a warm
+    snapshot.
+    """
+    from project.setup import SetupConfig, load_setup
+
+    results = dict()
+    load_setup(snapshot=True)  # write the snapshot
+    for label, load in (('SetupConfig + deepcopy', lambda: deepcopy(SetupConfig())),
+                        ('load_setup (no snapshot)', lambda: load_setup(snapshot=False)),
+                        ('load_setup (snapshot)', lambda: load_setup(snapshot=True))):
+        with stopwatch(results, label):
+            for _ in range(runs):
+                load()
+    return {label: seconds * 1000 / runs for label, seconds in results.items()}
+
+
+def bench_serve(workers=2, threads=8, requests=400, concurrency=32, latency=50):
+    """Load test of the first sign in path, service token -> get_or_create ->
+    userinfo fetch -> profile save, through gunicorn at the same worker count
+    with sync workers and with gthread workers of `threads` threads each.
+
+    `concurrency` clients send `requests` requests to /auth/finalize, each for
+    a new subject. Userinfo comes from a local stub standing in for Auth0
+    that answers after `latency` ms; the stub url is the token audience and
+    is listed in AUTH0_USERINFO_URLS so verify_user fetches it.
+    :return: requests/s, p50/p95 ms and errors per worker class
+    """
+    from flask import current_app
+    from project.models.user import UserProfile
+
+    setup = current_app.config['SETUP']
+    root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    stub = _userinfo_stub(latency / 1000.0)
+    audience = f'http://127.0.0.1:{stub.server_address[1]}/userinfo'
+    keys = {'bench': secrets.token_hex(32)}
+    results = dict()
+    try:
+        for label, worker_class, worker_threads in (('sync', 'sync', 1), ('gthread', 'gthread', threads)):
+            port = _free_port()
+            env = dict(os.environ, PYTHONPATH=root, PORT=str(port), WEB_CONCURRENCY=str(workers),
+                       GUNICORN_WORKER_CLASS=worker_class, GUNICORN_THREADS=str(worker_threads),
+                       API_AUDIENCE=audience, USERINFO_URLS=audience, SERVICE_TOKEN_ISSUER='bench',
+                       USERINFO_FRESHNESS='0',
+                       SERVICE_TOKEN_KEYS=','.join(f'{kid}:{secret}' for kid, secret in keys.items()))
+            server = subprocess.Popen([sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'project:app'],
+                                      cwd=root, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            try:
+                url = f'http://127.0.0.1:{port}/auth/finalize'
+                _wait_until_serving(f'http://127.0.0.1:{port}/')
+                tokens = [mint_service_token(keys, issuer='bench', audience=audience,
+                                             subject=f'{BENCH_PREFIX}serve|{label}|{i}',
+                                             algorithm=setup.SERVICE_TOKEN_ALGORITHM)
+                          for i in range(requests)]
+                start = time.perf_counter()
+                with ThreadPoolExecutor(max_workers=concurrency) as clients:
+                    timings = list(clients.map(lambda token: _timed_request(url, token), tokens))
+                elapsed = time.perf_counter() - start
+            finally:
+                server.terminate()
+                server.wait(timeout=30)
+            ok = sorted(seconds for seconds in timings if seconds is not None)
+            results[f'{label} x{workers} ({worker_threads} threads): requests/s'] = len(ok) / elapsed
+            results[f'{label} x{workers} ({worker_threads} threads): p50 ms'] = _percentile(ok, 50) * 1000
+            results[f'{label} x{workers} ({worker_threads} threads): p95 ms'] = _percentile(ok, 95) * 1000
+            results[f'{label} x{workers} ({worker_threads} threads): errors'] = len(timings) - len(ok)
+    finally:
+        stub.shutdown()
+        UserProfile.bulk_delete(UserProfile.alternate_id.startswith(BENCH_PREFIX))
+    return results
+
+
+def _userinfo_stub(delay):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            time.sleep(delay)
+            body = json.dumps({'nickname': 'bench'}).encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='userinfo-stub', daemon=True).start()
+    return server
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def _wait_until_serving(url, timeout=30.0):
+    expires_at = time.monotonic() + timeout
+    while True:
+        try:
+            urlopen(url, timeout=5).close()
+            return
+        except URLError:
+            if time.monotonic() > expires_at:
+                raise
+            time.sleep(0.2)
+
+
+def _timed_request(url, token):
+    start = time.perf_counter()
+    try:
+        with urlopen(Request(url, headers={'Authorization': f'Bearer {token}'}), timeout=60) as response:
+            response.read()
+    except (URLError, OSError):
+        return None
+    return time.perf_counter() - start
+
+
+def _percentile(samples, q):
+    if not samples:
+        return 0.0
+    return samples[min(int(round(q / 100.0 * (len(samples) - 1))), len(samples) - 1)]
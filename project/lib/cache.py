@@ -0,0 +1,133 @@
+"""
+Small in-process caches shared by the auth and database layers.
+"""
+
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+
+__all__ = ('LRUCache', )
+
+
+_MISSING = object()
+
+
+class LRUCache(object):
+    """Thread-safe, bounded LRU cache with optional per-entry expiry.
+
+    Entries expire at `expires_at` (epoch seconds) when given, otherwise after
+    the cache-wide `ttl` (seconds) when one is set. When `maxbytes` is set the
+    cache also evicts until the `sizeof(value)` estimates fit within it.
+
+    Usage:
+        cache = LRUCache(maxsize=1024, ttl=300)
+        cache.set('key', value, expires_at=payload['exp'])
+        value = cache.get('key')
+    """
+
+    def __init__(self, maxsize=1024, ttl=None, maxbytes=None, sizeof=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.maxbytes = maxbytes
+        self.sizeof = sizeof or sys.getsizeof
+        self._data = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def configure(self, maxsize=None, ttl=None, maxbytes=None):
+        with self._lock:
+            if maxsize is not None:
+                self.maxsize = maxsize
+            if ttl is not None:
+                self.ttl = ttl
+            if maxbytes is not None:
+                self.maxbytes = maxbytes
+            self._shrink()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is not _MISSING:
+                value, expires_at, size = entry
+                if expires_at is None or expires_at > time.time():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                self._remove(key)
+            self.misses += 1
+            return default
+
+    def set(self, key, value, ttl=None, expires_at=None):
+        ttl = self.ttl if ttl is None else ttl
+        if ttl is not None:
+            ttl_expiry = time.time() + ttl
+            expires_at = ttl_expiry if expires_at is None else min(expires_at, ttl_expiry)
+        if expires_at is not None and expires_at <= time.time():
+            return
+        size = self.sizeof(value) if self.maxbytes else 0
+        with self._lock:
+            self._remove(key)
+            self._data[key] = (value, expires_at, size)
+            self._bytes += size
+            self._shrink()
+
+    def pop(self, key, default=None):
+        with self._lock:
+            entry = self._remove(key)
+            return default if entry is _MISSING else entry[0]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def after_fork(self):
+        """Start a forked worker with an empty cache and a fresh lock."""
+        self._lock = threading.RLock()
+        self.clear()
+        self.reset_stats()
+
+    def reset_stats(self):
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+    @property
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'size': len(self._data),
+                'maxsize': self.maxsize,
+                'bytes': self._bytes,
+                'maxbytes': self.maxbytes,
+            }
+
+    def __len__(self):
+        return len(self._data)
+
+    ########################################
+    # Internal methods; Do not use directly
+    ########################################
+    def _remove(self, key):
+        entry = self._data.pop(key, _MISSING)
+        if entry is not _MISSING:
+            self._bytes -= entry[2]
+        return entry
+
+    def _shrink(self):
+        while self._data and (len(self._data) > self.maxsize
+                              or (self.maxbytes and self._bytes > self.maxbytes)):
+            key, entry = self._data.popitem(last=False)
+            self._bytes -= entry[2]
+            self.evictions += 1
@@ -0,0 +1,51 @@
+"""
+Small thread coordination helpers.
+"""
+
+import threading
+from contextlib import contextmanager
+
+
+__all__ = ('KeyedLocks', )
+
+
+class KeyedLocks(object):
+    """A lock per key, created on demand and dropped once nobody holds it.
+
+    Used to coalesce concurrent work on the same key within one process.
+
+    Usage:
+        locks = KeyedLocks()
+        with locks.hold(sub):
+            ...
+    """
+
+    def __init__(self):
+        self._guard = threading.Lock()
+        self._locks = dict()
+
+    @contextmanager
+    def hold(self, key):
+        with self._guard:
+            lock, waiters = self._locks.get(key, (None, 0))
+            if lock is None:
+                lock = threading.Lock()
+            self._locks[key] = (lock, waiters + 1)
+        try:
+            with lock:
+                yield
+        finally:
+            with self._guard:
+                lock, waiters = self._locks[key]
+                if waiters <= 1:
+                    del self._locks[key]
+                else:
+                    self._locks[key] = (lock, waiters - 1)
+
+    def after_fork(self):
+        """Drop locks inherited from the parent process, which may be held."""
+        self._guard = threading.Lock()
+        self._locks = dict()
+
+    def __len__(self):
+        return len(self._locks)
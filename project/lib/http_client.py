@@ -0,0 +1,169 @@
+"""
+Pooled keep-alive HTTP client for outbound auth calls (JWKS, userinfo).
+
+One `requests.Session` per process keeps TLS connections to Auth0 open between
+requests, every call carries connect/read timeouts, and several urls can be
+fetched concurrently. Each host sits behind its own circuit breaker.
+"""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from project.setup.loggers import LOGGERS
+from project.lib.resilience import CircuitBreaker, CircuitOpenError
+
+
+__all__ = ('HttpClient', 'HttpError', )
+
+
+log = LOGGERS.Auth
+
+
+class HttpError(Exception):
+    """
+    HttpError Exception
+        Raised for connection failures, timeouts and non-2xx responses
+    """
+    def __init__(self, url, message, status_code=None):
+        self.url = url
+        self.message = message
+        self.status_code = status_code
+        super().__init__(f'{url}: {message}')
+
+
+class HttpClient(object):
+    """Keep-alive HTTP client with per-call timeouts.
+
+    Usage:
+        client = HttpClient()
+        client.init_app(app)
+        data = client.get_json('https://example.com/userinfo', headers=headers)
+        results = client.get_json_many(urls, headers=headers)
+    """
+
+    def __init__(self, connect_timeout=3.05, read_timeout=5.0, pool_size=10,
+                 breaker_threshold=5, breaker_reset=30.0):
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.pool_size = pool_size
+        self.breaker_threshold = breaker_threshold
+        self.breaker_reset = breaker_reset
+        self._session = None
+        self._executor = None
+        self._breakers = dict()
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        setup = app.config['SETUP']
+        self.connect_timeout = setup.HTTP_CONNECT_TIMEOUT
+        self.read_timeout = setup.HTTP_READ_TIMEOUT
+        self.pool_size = setup.HTTP_POOL_SIZE
+        if self.pool_size < setup.GUNICORN_THREADS:
+            log.warning('HTTP_POOL_SIZE (%d) is below GUNICORN_THREADS (%d): '
+                        'extra connections will not be kept alive', self.pool_size, setup.GUNICORN_THREADS)
+        self.breaker_threshold = setup.HTTP_BREAKER_THRESHOLD
+        self.breaker_reset = setup.HTTP_BREAKER_RESET
+        self._breakers = dict()
+        self.close()
+
+    @property
+    def session(self):
+        if self._session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            self._session = session
+        return self._session
+
+    @property
+    def executor(self):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.pool_size, thread_name_prefix='http-client')
+        return self._executor
+
+    def timeout(self, connect=None, read=None, within=None):
+        """(connect, read) timeouts, clipped to `within` seconds when given."""
+        connect, read = connect or self.connect_timeout, read or self.read_timeout
+        if within is not None:
+            connect, read = min(connect, within), min(read, within)
+        return (connect, read)
+
+    def breaker(self, url):
+        """Return the circuit breaker guarding the host of `url`."""
+        host = urlsplit(url).netloc
+        breaker = self._breakers.get(host)
+        if breaker is None:
+            with self._lock:
+                breaker = self._breakers.setdefault(
+                    host, CircuitBreaker(host, failure_threshold=self.breaker_threshold,
+                                         reset_timeout=self.breaker_reset))
+        return breaker
+
+    @property
+    def breakers(self):
+        return {host: breaker.snapshot for host, breaker in self._breakers.items()}
+
+    def get_json(self, url, headers=None, timeout=None):
+        """GET `url` and decode its json body.
+
+        :param timeout: optional (connect, read) tuple overriding the defaults
+        :return: decoded json
+        Raises HttpError on connection errors, timeouts, non-2xx statuses and
+        while the host's breaker is open. Only connection errors, timeouts
+        and 5xx responses count against the breaker.
+        """
+        breaker = self.breaker(url)
+        try:
+            breaker.before_call()
+        except CircuitOpenError as e:
+            raise HttpError(url, str(e))
+        try:
+            response = self.session.get(url, headers=headers, timeout=timeout or self.timeout())
+            response.raise_for_status()
+            data = response.json()
+        except requests.HTTPError as e:
+            status_code = e.response.status_code
+            if status_code >= 500:
+                breaker.record_failure()
+            else:
+                breaker.record_success()
+            raise HttpError(url, str(e), status_code)
+        except (requests.RequestException, ValueError) as e:
+            breaker.record_failure()
+            raise HttpError(url, str(e))
+        breaker.record_success()
+        return data
+
+    def get_json_many(self, urls, headers=None, timeout=None):
+        """GET several urls concurrently.
+
+        :return: dict of url => decoded json, in the order of `urls`
+        Raises the first HttpError encountered.
+        """
+        urls = list(urls)
+        if len(urls) == 1:
+            return {urls[0]: self.get_json(urls[0], headers=headers, timeout=timeout)}
+        futures = [(url, self.executor.submit(self.get_json, url, headers, timeout)) for url in urls]
+        return {url: future.result() for url, future in futures}
+
+    def after_fork(self):
+        """Forget the parent's pooled sockets and executor threads without
+        closing them, they still belong to the parent process.
+        """
+        self._lock = threading.Lock()
+        self._session = None
+        self._executor = None
+        self._breakers = dict()
+
+    def close(self):
+        if self._session is not None:
+            self._session.close()
+            self._session = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
@@ -0,0 +1,200 @@
+"""
+In-process cache of the Auth0 JSON Web Key Set.
+
+Keys are parsed once and indexed by `kid`. A background thread refreshes the
+set every `ttl` seconds; the network is only hit early when a token presents
+an unknown `kid`, and those refetches are rate limited by `min_refresh`.
+An expired set keeps being served while the background thread revalidates it;
+requests only block on the network when no keys have been loaded yet.
+"""
+
+import threading
+import time
+
+from project.setup.loggers import LOGGERS
+from project.lib.http_client import HttpClient, HttpError
+from project.lib.metrics import metrics
+
+
+__all__ = ('JwksKeyStore', )
+
+
+log = LOGGERS.Auth
+
+
+class JwksKeyStore(object):
+    """Thread-safe store of RSA keys indexed by key id (kid).
+
+    Usage:
+        store = JwksKeyStore()
+        store.init_app(app)
+        rsa_key = store.get_key(unverified_header['kid'])
+    """
+
+    def __init__(self, url=None, ttl=600, min_refresh=30, client=None):
+        self.url = url
+        self.client = client or HttpClient()
+        self.ttl = ttl
+        self.min_refresh = min_refresh
+        self._keys = dict()
+        self._fetched_at = 0.0
+        self._last_attempt = 0.0
+        self._lock = threading.Lock()
+        self._refresher = None
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+
+    def init_app(self, app):
+        setup = app.config['SETUP']
+        self.url = f'https://{setup.AUTH0_DOMAIN}/.well-known/jwks.json'
+        self.ttl = setup.AUTH0_JWKS_TTL
+        self.min_refresh = setup.AUTH0_JWKS_MIN_REFRESH
+
+    @property
+    def keys(self):
+        return dict(self._keys)
+
+    @property
+    def is_stale(self):
+        return time.monotonic() - self._fetched_at > self.ttl
+
+    def get_key(self, kid, timeout=None):
+        """Return the rsa key dict for `kid` or None.
+
+        Fetches synchronously only on first use, and at most once every
+        `min_refresh` seconds when `kid` is unknown. Concurrent callers share
+        one fetch: whoever takes the lock fetches, the others wait (no longer
+        than `timeout`) and re-use its result. A stale set is served while a
+        background refresh is requested.
+        :param timeout: optional (connect, read) tuple for a synchronous fetch
+        Raises HttpError only when no keys are available at all.
+        """
+        self._ensure_refresher()
+        if not self._keys:
+            self._refetch(None, timeout=timeout)
+        elif self.is_stale:
+            self._wake.set()
+        key = self._keys.get(kid)
+        if key is None and self._may_refetch():
+            log.debug('JWKS: unknown kid %s, refetching', kid)
+            try:
+                self._refetch(kid, timeout=timeout)
+            except HttpError as e:
+                log.warning('JWKS: refetch for kid %s failed: %s', kid, e)
+            key = self._keys.get(kid)
+        return key
+
+    def refresh(self, timeout=None):
+        """Fetch and parse the key set, replacing the cached keys."""
+        with self._lock:
+            return self._refresh(timeout=timeout)
+
+    def clear(self):
+        with self._lock:
+            self._keys = dict()
+            self._fetched_at = 0.0
+            self._last_attempt = 0.0
+
+    def after_fork(self):
+        """Keep the loaded keys but replace the lock, events and the refresh
+        thread, none of which survive into a forked worker.
+        """
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._refresher = None
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        self._refresher = None
+
+    @staticmethod
+    def parse(jwks):
+        """Index the `keys` of a JWKS document by kid."""
+        keys = dict()
+        for key in jwks.get('keys', []):
+            keys[key['kid']] = {
+                'kty': key['kty'],
+                'kid': key['kid'],
+                'use': key['use'],
+                'n': key['n'],
+                'e': key['e']
+            }
+        return keys
+
+    ########################################
+    # Internal methods; Do not use directly
+    ########################################
+    def _fetch(self, timeout=None):
+        with metrics.timer('auth.jwks_fetch'):
+            return self.client.get_json(self.url, timeout=timeout)
+
+    def _refetch(self, kid, timeout=None):
+        # fetch on behalf of a request unless another caller already did so
+        # while this one waited for the lock
+        requested_at = time.monotonic()
+        if not self._lock.acquire(timeout=_lock_timeout(timeout)):
+            if not self._keys:
+                raise HttpError(self.url, 'timed out waiting for a concurrent JWKS fetch')
+            return self._keys
+        try:
+            if self._last_attempt >= requested_at:
+                if not self._keys:
+                    raise HttpError(self.url, 'concurrent JWKS fetch failed')
+                return self._keys
+            if self._keys and (kid is None or kid in self._keys or not self._may_refetch()):
+                return self._keys
+            return self._refresh(timeout=timeout)
+        finally:
+            self._lock.release()
+
+    def _refresh(self, timeout=None):
+        # caller holds self._lock
+        self._last_attempt = time.monotonic()
+        jwks = self._fetch(timeout=timeout)
+        self._keys = self.parse(jwks)
+        self._fetched_at = time.monotonic()
+        log.debug('JWKS: loaded %d keys', len(self._keys))
+        return self._keys
+
+    def _may_refetch(self):
+        return time.monotonic() - self._last_attempt >= self.min_refresh
+
+    def _ensure_refresher(self):
+        if self._refresher is not None and self._refresher.is_alive():
+            return
+        with self._lock:
+            if self._refresher is not None and self._refresher.is_alive():
+                return
+            self._stop.clear()
+            self._refresher = threading.Thread(target=self._refresh_loop, name='jwks-refresh', daemon=True)
+            self._refresher.start()
+
+    def _next_refresh_in(self):
+        # refresh a little ahead of expiry so requests never see a stale set
+        age = time.monotonic() - self._fetched_at
+        return max(self.ttl * 0.9 - age, float(self.min_refresh))
+
+    def _refresh_loop(self):
+        while True:
+            self._wake.wait(self._next_refresh_in())
+            self._wake.clear()
+            if self._stop.is_set():
+                return
+            if not self._may_refetch():
+                continue
+            try:
+                self.refresh()
+            except Exception as e:
+                # keep serving the last known keys until the next attempt
+                log.warning('JWKS: background refresh failed: %s', e)
+
+
+def _lock_timeout(timeout):
+    # threading.Lock.acquire takes -1 for no limit
+    if timeout is None:
+        return -1
+    if isinstance(timeout, (tuple, list)):
+        return sum(timeout)
+    return timeout
@@ -4,8 +4,10 @@ https://bobwaycott.com/blog/how-i-use-flask/organizing-flask-models-with-automat
 https://blog.miguelgrinberg.com/post/the-flask-mega-tutorial-part-i-hello-world
 """
 
+import json
+import os
 from os import walk
-from os.path import abspath, basename, dirname, join
+from os.path import abspath, basename, dirname, join, relpath
 from sys import modules
 from importlib import import_module
 from inspect import isclass
@@ -17,6 +19,11 @@ from flask_sqlalchemy import Model
 PROJ_DIR = abspath(join(dirname(abspath(__file__)), '..'))
 APP_MODULE = basename(PROJ_DIR)
 
+# generated list of model classes, see `load_manifest`; kept outside of
+# `models` so writing it does not touch the directory mtimes it records
+MANIFEST_PATH = join(PROJ_DIR, '.model-manifest.json')
+MANIFEST_VERSION = 2
+
 
 def get_modules(module):
     """
@@ -45,11 +52,15 @@ def dynamic_loader(module, compare):
     Returns unique list of matches found.
     """
     items = []
+    seen = set()
     for mod in get_modules(module):
         module = import_module(mod)
         if hasattr(module, '__all__'):
-            objs = [getattr(module, obj) for obj in module.__all__]
-            items += [o for o in objs if compare(o) and o not in items]
+            for obj in module.__all__:
+                o = getattr(module, obj)
+                if compare(o) and id(o) not in seen:
+                    seen.add(id(o))
+                    items.append(o)
     return items
 
 
@@ -63,7 +74,91 @@ def is_model(item):
     return isclass(item) and issubclass(item, Model)  # and not item.__ignore__()
 
 
-def load_models():
-    """Load application models for management script & app availability."""
-    for model in get_models():
+def load_models(use_manifest=True):
+    """Load application models for management script & app availability.
+
+    By default the modules listed in the model manifest are imported
+    directly, at the cost of one stat per directory under `models` instead
+    of walking it and importing every module found. Every listed model is
+    still imported, since the app needs them all in the metadata. Pass
+    use_manifest=False to always discover dynamically.
+    """
+    if use_manifest:
+        manifest = load_manifest()
+        models = [getattr(import_module(mod), name) for mod, name in manifest['models']]
+    else:
+        models = get_models()
+    for model in models:
         setattr(modules[__name__], model.__name__, model)
+
+
+def load_manifest(refresh=False):
+    """Return the model manifest, regenerating it when `refresh` is set, when
+    it is missing or when a directory under `models` changed, i.e. a module
+    was added, removed or renamed.
+
+    The manifest lists (module path, class name) of every model and the
+    mtimes of the directories it was built from, so checking it costs a stat
+    per directory. Edits inside existing modules (a new or renamed model
+    class) are not detected: run `python manage.py model_manifest`, which
+    refreshes it; manage.py itself always discovers models dynamically.
+    """
+    manifest = None if refresh else _read_manifest()
+    if manifest is None or not _manifest_is_fresh(manifest):
+        manifest = build_manifest()
+        _write_manifest(manifest)
+    return manifest
+
+
+def build_manifest():
+    """Discover models dynamically and return a fresh manifest."""
+    models = get_models()
+    return {
+        'version': MANIFEST_VERSION,
+        'models': [[model.__module__, model.__name__] for model in models],
+        'directories': _directory_mtimes(),
+    }
+
+
+########################################
+# Internal methods; Do not use directly
+########################################
+def _directory_mtimes(module='models'):
+    """Return relative path => mtime (ns) of `module` and its package directories."""
+    mtimes = dict()
+    for root, dirnames, files in walk(abspath(join(PROJ_DIR, module))):
+        dirnames[:] = [d for d in dirnames if d != '__pycache__']
+        mtimes[relpath(root, PROJ_DIR)] = os.stat(root).st_mtime_ns
+    return mtimes
+
+
+def _manifest_is_fresh(manifest):
+    # adding, removing or renaming a module (or a sub package, whose parent
+    # changes too) updates the mtime of its directory
+    if manifest.get('version') != MANIFEST_VERSION or not manifest.get('directories'):
+        return False
+    try:
+        return all(os.stat(join(PROJ_DIR, path)).st_mtime_ns == mtime
+                   for path, mtime in manifest['directories'].items())
+    except OSError:
+        return False
+
+
+def _read_manifest():
+    try:
+        with open(MANIFEST_PATH) as manifest_file:
+            return json.load(manifest_file)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_manifest(manifest):
+    # write then rename, so concurrently booting workers never read a partial file
+    temp_path = f'{MANIFEST_PATH}.{os.getpid()}'
+    try:
+        with open(temp_path, 'w') as manifest_file:
+            json.dump(manifest, manifest_file, indent=2, sort_keys=True)
+        os.replace(temp_path, MANIFEST_PATH)
+    except OSError:
+        # read-only deploys keep working, they just rebuild the manifest on every start
+        pass
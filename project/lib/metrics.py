@@ -0,0 +1,126 @@
+"""
+In-process latency histograms and gauges.
+
+Nothing is exported to an external collector; `metrics.snapshot()` returns
+everything recorded by this process, and `metrics.dump()` renders it as json.
+"""
+
+import json
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+
+__all__ = ('Histogram', 'MetricsRegistry', 'metrics', )
+
+
+class Histogram(object):
+    """Latency histogram over a sliding window of the most recent samples.
+
+    count/total/max cover every observation; percentiles cover the window.
+    """
+
+    def __init__(self, window=2048):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        with self._lock:
+            self._samples.append(value)
+            self.count += 1
+            self.total += value
+            if value > self.max:
+                self.max = value
+
+    def percentile(self, q, samples=None):
+        if samples is None:
+            with self._lock:
+                samples = sorted(self._samples)
+        if not samples:
+            return 0.0
+        index = min(int(round(q / 100.0 * (len(samples) - 1))), len(samples) - 1)
+        return samples[index]
+
+    @property
+    def summary(self):
+        with self._lock:
+            samples = sorted(self._samples)
+            count, total, maximum = self.count, self.total, self.max
+        return {
+            'count': count,
+            'mean': total / count if count else 0.0,
+            'p50': self.percentile(50, samples),
+            'p95': self.percentile(95, samples),
+            'p99': self.percentile(99, samples),
+            'max': maximum,
+        }
+
+
+class MetricsRegistry(object):
+    """Named histograms plus callables sampled on every snapshot.
+
+    Usage:
+        with metrics.timer('auth.signature'):
+            ...
+        metrics.register_gauge('auth.token_cache', lambda: token_cache.stats)
+        metrics.snapshot()
+    """
+
+    def __init__(self, window=2048):
+        self.window = window
+        self._histograms = dict()
+        self._gauges = dict()
+        self._lock = threading.Lock()
+
+    def histogram(self, name):
+        histogram = self._histograms.get(name)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(name, Histogram(self.window))
+        return histogram
+
+    def observe(self, name, value):
+        self.histogram(name).observe(value)
+
+    @contextmanager
+    def timer(self, name):
+        """Observe the seconds spent inside the block under `name`."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def register_gauge(self, name, func):
+        self._gauges[name] = func
+        return func
+
+    def snapshot(self):
+        histograms = {name: histogram.summary for name, histogram in sorted(self._histograms.items())}
+        gauges = dict()
+        for name, func in sorted(self._gauges.items()):
+            try:
+                gauges[name] = func()
+            except Exception as e:
+                gauges[name] = f'error: {e}'
+        return {'histograms': histograms, 'gauges': gauges}
+
+    def dump(self, indent=4):
+        return json.dumps(self.snapshot(), indent=indent, default=str)
+
+    def clear(self):
+        with self._lock:
+            self._histograms = dict()
+
+    def after_fork(self):
+        """Start a forked worker with its own, empty histograms."""
+        self._lock = threading.Lock()
+        self.clear()
+
+
+# process wide registry
+metrics = MetricsRegistry()
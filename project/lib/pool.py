@@ -0,0 +1,69 @@
+"""
+Connection pool telemetry.
+
+`InstrumentedQueuePool` is a QueuePool that records how long checkouts wait
+for a connection (the `db.pool_wait` histogram) and how many gave up after
+`pool_timeout`; `pool_stats(pool)` reports those alongside the live counts.
+"""
+
+import threading
+import time
+
+from sqlalchemy import exc
+from sqlalchemy.pool import QueuePool
+
+from project.lib.metrics import metrics
+
+
+__all__ = ('InstrumentedQueuePool', 'pool_stats', )
+
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool counting checkout waits and timeouts.
+
+    Usage:
+        create_engine(url, poolclass=InstrumentedQueuePool, pool_size=5)
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._checkout = threading.local()
+        self._counter_lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+
+    def _do_get(self):
+        # QueuePool._do_get retries by calling itself; only time the outer call
+        if getattr(self._checkout, 'active', False):
+            return super()._do_get()
+        self._checkout.active = True
+        start = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except exc.TimeoutError:
+            with self._counter_lock:
+                self.timeouts += 1
+            raise
+        finally:
+            self._checkout.active = False
+            metrics.observe('db.pool_wait', time.perf_counter() - start)
+        with self._counter_lock:
+            self.checkouts += 1
+        return connection
+
+
+def pool_stats(pool):
+    """Return the live counters of `pool` (any pool class) as a dict."""
+    stats = {'class': type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        stats.update({
+            'size': pool.size(),
+            'checked_in': pool.checkedin(),
+            'checked_out': pool.checkedout(),
+            'overflow': max(pool.overflow(), 0),
+            'max_overflow': pool._max_overflow,
+            'timeout': pool.timeout(),
+        })
+    if isinstance(pool, InstrumentedQueuePool):
+        stats.update({'checkouts': pool.checkouts, 'timeouts': pool.timeouts})
+    return stats
@@ -0,0 +1,132 @@
+"""
+Failure isolation for outbound dependencies (Auth0).
+
+`CircuitBreaker` stops calling a dependency after repeated failures and lets a
+single trial call through once `reset_timeout` has passed. `Deadline` tracks
+what is left of a per-request latency budget.
+"""
+
+import threading
+import time
+
+
+__all__ = ('CircuitBreaker', 'CircuitOpenError', 'Deadline', )
+
+
+class CircuitOpenError(Exception):
+    """
+    CircuitOpenError Exception
+        Raised instead of calling a dependency whose breaker is open
+    """
+    def __init__(self, name, retry_in):
+        self.name = name
+        self.retry_in = retry_in
+        super().__init__(f'circuit {name} open, retry in {retry_in:.1f}s')
+
+
+class CircuitBreaker(object):
+    """Closed -> open after `failure_threshold` consecutive failures,
+    open -> half_open after `reset_timeout` seconds, half_open -> closed on
+    the first success or back to open on the first failure.
+
+    Usage:
+        breaker.before_call()      # raises CircuitOpenError while open
+        try:
+            result = call()
+        except Exception:
+            breaker.record_failure()
+            raise
+        breaker.record_success()
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_running = False
+        self._lock = threading.Lock()
+        self.trips = 0
+        self.rejected = 0
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._state == self.OPEN and self._retry_in() <= 0:
+                return self.HALF_OPEN
+            return self._state
+
+    def before_call(self):
+        with self._lock:
+            if self._state == self.CLOSED:
+                return
+            if self._state == self.OPEN and self._retry_in() > 0:
+                self.rejected += 1
+                raise CircuitOpenError(self.name, self._retry_in())
+            # half open: let exactly one trial call through
+            if self._trial_running:
+                self.rejected += 1
+                raise CircuitOpenError(self.name, self.reset_timeout)
+            self._state = self.HALF_OPEN
+            self._trial_running = True
+
+    def record_success(self):
+        with self._lock:
+            self._state = self.CLOSED
+            self._failures = 0
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != self.OPEN:
+                    self.trips += 1
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+            self._trial_running = False
+
+    def reset(self):
+        with self._lock:
+            self._state = self.CLOSED
+            self._failures = 0
+            self._trial_running = False
+
+    @property
+    def snapshot(self):
+        state = self.state
+        with self._lock:
+            return {
+                'state': state,
+                'failures': self._failures,
+                'trips': self.trips,
+                'rejected': self.rejected,
+                'retry_in': max(self._retry_in(), 0.0) if self._state == self.OPEN else 0.0,
+            }
+
+    ########################################
+    # Internal methods; Do not use directly
+    ########################################
+    def _retry_in(self):
+        return self._opened_at + self.reset_timeout - time.monotonic()
+
+
+class Deadline(object):
+    """Remaining time of a latency budget started at construction."""
+
+    def __init__(self, budget):
+        self.budget = budget
+        self.expires_at = time.monotonic() + budget
+
+    @property
+    def remaining(self):
+        return self.expires_at - time.monotonic()
+
+    @property
+    def expired(self):
+        return self.remaining <= 0
@@ -0,0 +1,175 @@
+"""
+Per-request SQL profiling.
+
+Engine events time every statement executed while a request is active.
+After the request the count, total DB time and slowest statements are
+logged to the Database logger; statement shapes repeated within a single
+request are reported as likely N+1 queries. Slow requests get an EXPLAIN
+of their slowest SELECTs, run on the engine that executed them once the
+response has been sent.
+"""
+
+import logging
+import time
+from collections import Counter
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from project.lib.metrics import metrics
+from project.setup.loggers import LOGGERS
+
+
+__all__ = ('SqlProfiler', 'RequestSqlProfile', )
+
+
+log = LOGGERS.Database
+# execution option marking the profiler's own EXPLAIN statements
+_EXPLAIN_OPTION = 'sql_profile_explain'
+
+
+class RequestSqlProfile(object):
+    """Statements executed during one request."""
+
+    def __init__(self, top=3):
+        self.top = top
+        self.count = 0
+        self.total = 0.0
+        self.shapes = Counter()
+        self.slowest = list()  # [(seconds, statement, parameters, engine)], slowest first
+
+    def record(self, statement, parameters, seconds, engine):
+        self.count += 1
+        self.total += seconds
+        self.shapes[statement] += 1
+        if len(self.slowest) < self.top or seconds > self.slowest[-1][0]:
+            self.slowest.append((seconds, statement, parameters, engine))
+            self.slowest.sort(key=lambda entry: entry[0], reverse=True)
+            del self.slowest[self.top:]
+
+    def repeated(self, threshold):
+        """Return {statement: count} of shapes executed at least `threshold` times."""
+        return {statement: count for statement, count in self.shapes.items() if count >= threshold}
+
+    @property
+    def server_timing(self):
+        return f'db;desc="{self.count} queries";dur={self.total * 1000:.1f}'
+
+
+class SqlProfiler(object):
+    """Times statements on every engine and reports them per request.
+
+    Usage:
+        sql_profiler = SqlProfiler()
+        sql_profiler.init_app(app)
+    """
+
+    def __init__(self, n_plus_one=5, slow_request=0.5, top=3, header=False):
+        self.enabled = False
+        self.n_plus_one = n_plus_one
+        self.slow_request = slow_request
+        self.top = top
+        self.header = header
+        self._listening = False
+
+    def init_app(self, app):
+        setup = app.config['SETUP']
+        self.enabled = setup.SQL_PROFILE_ENABLED
+        self.n_plus_one = setup.SQL_PROFILE_N_PLUS_ONE
+        self.slow_request = setup.SQL_PROFILE_SLOW_REQUEST / 1000.0
+        self.top = setup.SQL_PROFILE_TOP
+        self.header = setup.SQL_PROFILE_HEADER
+        if not self.enabled:
+            return
+        if not self._listening:
+            event.listen(Engine, 'before_cursor_execute', self._before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', self._after_cursor_execute)
+            self._listening = True
+        app.after_request(self._after_request)
+
+    @property
+    def current(self):
+        """The profile of the active request, or None outside of one."""
+        if not self.enabled or not has_request_context():
+            return None
+        profile = g.get('sql_profile')
+        if profile is None:
+            profile = g.sql_profile = RequestSqlProfile(top=self.top)
+        return profile
+
+    def explain(self, connection, statement, parameters, dialect):
+        """Return the query plan lines of a SELECT, or None for other statements."""
+        if not statement.lstrip().upper().startswith('SELECT'):
+            return None
+        prefix = 'EXPLAIN QUERY PLAN ' if dialect == 'sqlite' else 'EXPLAIN '
+        rows = connection.execution_options(**{_EXPLAIN_OPTION: True}) \
+            .exec_driver_sql(prefix + statement, parameters).fetchall()
+        return [' '.join(str(column) for column in row) for row in rows]
+
+    ########################################
+    # Internal methods; Do not use directly
+    ########################################
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        # kept on the execution context, which is discarded with a statement
+        # that raises, rather than on the pooled connection
+        if context is not None:
+            context.sql_profile_start = time.perf_counter()
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        start = getattr(context, 'sql_profile_start', None)
+        if start is None or conn.get_execution_options().get(_EXPLAIN_OPTION):
+            return
+        profile = self.current
+        if profile is not None:
+            profile.record(statement, parameters, time.perf_counter() - start, conn.engine)
+
+    def _after_request(self, response):
+        profile = g.get('sql_profile')
+        if profile is None or not profile.count:
+            return response
+        metrics.observe('db.request_time', profile.total)
+        metrics.observe('db.request_queries', profile.count)
+        repeated = profile.repeated(self.n_plus_one)
+        slow = profile.total >= self.slow_request
+        level = logging.WARNING if repeated or slow else logging.DEBUG
+        if log.isEnabledFor(level):
+            summary = f'{request.method} {request.path}: {profile.count} queries in {profile.total * 1000:.1f}ms'
+            lines = [summary]
+            for statement, count in repeated.items():
+                lines.append(f'  possible N+1, {count}x: {_shorten(statement)}')
+            for seconds, statement, parameters, engine in profile.slowest:
+                lines.append(f'  {seconds * 1000:.1f}ms: {_shorten(statement)}')
+            log.log(level, '\n'.join(lines))
+            if slow:
+                # EXPLAIN costs more round trips; keep them out of the slow request
+                response.call_on_close(lambda: self._explain_slowest(summary, profile.slowest))
+        if self.header:
+            timing = profile.server_timing
+            if response.headers.get('Server-Timing'):
+                timing = f"{response.headers['Server-Timing']}, {timing}"
+            response.headers['Server-Timing'] = timing
+        return response
+
+    def _explain_slowest(self, summary, slowest):
+        """Log the plans of `slowest`; runs after the response is sent."""
+        lines = list()
+        for seconds, statement, parameters, engine in slowest:
+            if isinstance(parameters, list):  # executemany
+                continue
+            try:
+                with engine.connect() as connection:
+                    plan = self.explain(connection, statement, parameters, engine.dialect.name)
+            except Exception as e:
+                log.debug('SQL profile: EXPLAIN failed: %s', e)
+                continue
+            if plan:
+                lines.append(f'  EXPLAIN {_shorten(statement)}')
+                lines.extend(f'    {line}' for line in plan)
+        if lines:
+            log.warning('\n'.join([summary] + lines))
+
+
+def _shorten(statement, length=200):
+    statement = ' '.join(statement.split())
+    return statement if len(statement) <= length else statement[:length] + '...'
@@ -14,8 +14,9 @@ https://bobwaycott.com/blog/how-i-use-flask/query-helpers-for-sqlalchemy-models/
 
 from arrow import utcnow
 from sqlalchemy.ext.declarative import declared_attr, has_inherited_table
-from sqlalchemy_utils import ArrowType
+from sqlalchemy import event, inspect
 from sqlalchemy.exc import StatementError
+from sqlalchemy.orm import object_session
 
 
 ###########################################
@@ -25,7 +26,8 @@ from sqlalchemy.exc import StatementError
 
 from project.db import db
 from project.setup.loggers import LOGGERS
-from .mixins.query import QueryMixin
+from .mixins.query import QueryMixin, CachedQuery, transaction
+from .types import ArrowType
 
 
 log = LOGGERS.Database
@@ -34,6 +36,10 @@ log = LOGGERS.Database
 __all__ = ('Model', 'ApiDatabaseError', )
 
 
+# model class => {attribute name: column} settable through Model.update_version
+_updatable_columns = dict()
+
+
 class ApiDatabaseError(Exception):
     """
     AuthError Exception
@@ -47,7 +53,8 @@ class ApiDatabaseError(Exception):
 class Model(db.Model, QueryMixin):
     """Abstract base class for all app models.
 
-    Provides an `id` & `created_at` column to every model.
+    Provides an `id`, `created_at` & `version` column to every model. `version`
+    is the optimistic concurrency counter: every ORM update checks and bumps it.
 
     To define models, follow this example:
 
@@ -57,6 +64,7 @@ class Model(db.Model, QueryMixin):
             # model definition
     """
     __abstract__ = True
+    query_class = CachedQuery
 
     id = db.Column(db.Integer, primary_key=True)
 
@@ -64,6 +72,12 @@ class Model(db.Model, QueryMixin):
     def created_at(cls):
         return db.Column(ArrowType, default=utcnow, nullable=False, index=True)
 
+    # bumped by every ORM update (see _bump_version) but only checked by
+    # update_version; ORM flushes are not optimistically locked
+    @declared_attr
+    def version(cls):
+        return db.Column(db.Integer, default=1, server_default='1', nullable=False)
+
     @property
     def class_name(self):
         """Shortcut for returning class name."""
@@ -118,39 +132,104 @@ class Model(db.Model, QueryMixin):
     def __skip_attrs__(self):
         return []
 
-    def update(self, data):
+    def update(self, data, expire_on_commit=False):
+        """Set the fields in `data` and save.
+
+        Runs inside `transaction`, so several updates in an enclosing
+        transaction are committed together. The instance is not expired by
+        the commit unless `expire_on_commit` is set, so the returned
+        dictionary is serialized without reloading it.
+
+        Returns self.dictionary.
+        """
         caught_id = data.get('id')
         if caught_id and self.id != caught_id:
-            _id = self.id
-            db.session.close()
             raise ApiDatabaseError(403,
-                                   f"Cannot modify primary keys got:({caught_id}) for: {_id}")
-        invalid_keys = list()
-        for key, value in data.items():
-            if any([key == skip for skip in self.__skip_attrs__]) or not hasattr(self, key):
-                invalid_keys.append(value)
+                                   f"Cannot modify primary keys got:({caught_id}) for: {self.id}")
+        skip_attrs = set(self.__skip_attrs__)
+        invalid_keys = [key for key in data if key in skip_attrs or not hasattr(self, key)]
         if len(invalid_keys) > 0:
-            db.session.close()
             raise ApiDatabaseError(422, f"Invalid Database Fields: {','.join(invalid_keys)}")
-        else:
-            for key, value in data.items():
-                try:
-                    setattr(self, key, value)
-                except Exception as e:
-                    log.exception(e)
-                    db.session.close()
-                    raise ApiDatabaseError(400, f"Rejected for : {key}")
-            try:
-                returns = self.dictionary
+        try:
+            with transaction(expire_on_commit=expire_on_commit):
+                for key, value in data.items():
+                    try:
+                        setattr(self, key, value)
+                    except Exception as e:
+                        log.exception(e)
+                        raise ApiDatabaseError(400, f"Rejected for : {key}")
                 self.save()
-                db.session.close()
-                return returns
-            except StatementError as e:
-                db.session.close()
-                raise ApiDatabaseError(400, f'Rejected for: {e.orig}')
-        raise ApiDatabaseError(400, f'Rejected!')
+        except StatementError as e:
+            raise ApiDatabaseError(400, f'Rejected for: {e.orig}')
+        return self.dictionary
+
+    @classmethod
+    def update_version(cls, id, version, data):
+        """Update the columns in `data` of the row `id` without loading it,
+        provided its version is still `version`.
+
+        Emits a single UPDATE .. WHERE id = :id AND version = :version that also
+        bumps the version. An instance of the row in the session is expired.
+
+        Example:
+
+            version = UserProfile.update_version(1, request_version, {'nickname': 'moo'})
+
+        Returns the new version.
+        Raises ApiDatabaseError 422 for fields that are not updatable columns,
+        404 if the row does not exist and 409 if its version has moved on.
+        """
+        columns = cls._updatable_columns()
+        invalid_keys = [key for key in data if key not in columns]
+        if len(invalid_keys) > 0:
+            raise ApiDatabaseError(422, f"Invalid Database Fields: {','.join(invalid_keys)}")
+        table = cls.__table__
+        values = {columns[key]: value for key, value in data.items()}
+        values[table.c.version] = table.c.version + 1
+        stmt = table.update() \
+            .where(table.c.id == id) \
+            .where(table.c.version == version) \
+            .values(values)
+        try:
+            with transaction():
+                result = db.session.execute(stmt)
+                if result.rowcount == 0:
+                    if db.session.query(cls.id).filter(cls.id == id).first() is None:
+                        raise ApiDatabaseError(404, f"Not found: {id}")
+                    raise ApiDatabaseError(409, f"Conflicting update for: {id} at version {version}")
+                cls._commit((id,))
+        except StatementError as e:
+            raise ApiDatabaseError(400, f'Rejected for: {e.orig}')
+        instance = db.session.identity_map.get(inspect(cls).identity_key_from_primary_key([id]))
+        if instance is not None:
+            db.session.expire(instance)
+        return version + 1
+
+    ########################################
+    # Internal methods; Do not use directly
+    ########################################
+    @classmethod
+    def _updatable_columns(cls):
+        """Return attribute name => table column of the columns `update_version`
+        may set, computed once per model.
+        """
+        columns = _updatable_columns.get(cls)
+        if columns is None:
+            mapper = inspect(cls)
+            excluded = {column.key for column in mapper.primary_key} | {'created_at', 'version'}
+            columns = {attr.key: attr.columns[0] for attr in mapper.column_attrs if attr.key not in excluded}
+            _updatable_columns[cls] = columns
+        return columns
 
     @staticmethod
     def toTimeString(time_stamp):
         timezone = 'US/Mountain'
         return str(time_stamp.to(timezone))
+
+
+@event.listens_for(Model, 'before_update', propagate=True)
+def _bump_version(mapper, connection, target):
+    # SET version = version + 1, so the counter moves even when the
+    # instance was loaded from a stale cached row
+    if object_session(target).is_modified(target, include_collections=False):
+        target.version = type(target).version + 1
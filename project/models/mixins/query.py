@@ -10,17 +10,131 @@ https://bobwaycott.com/blog/how-i-use-flask/query-helpers-for-sqlalchemy-models/
 # Library import statements
 ###########################################
 
+import json
+import sys
+import threading
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from contextlib import contextmanager
+from itertools import islice
+
 from flask import abort, current_app as app
+from flask_sqlalchemy import BaseQuery
+from sqlalchemy import bindparam, inspect, literal, tuple_
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import make_transient_to_detached
+from sqlalchemy.orm.attributes import set_committed_value
 # from sqlalchemy.orm.exc import ObjectDeletedError (? unused)
 
 ###########################################
 # Project import statements
 ###########################################
 
-from project.db import db
-
-
-__all__ = ('QueryMixin',)
+from project.db import db, REPLICA_OPTION, use_primary
+from project.lib.cache import LRUCache
+from project.lib.metrics import metrics
+
+
+__all__ = ('QueryMixin', 'CachedQuery', 'result_cache', 'transaction', )
+
+
+# model class => [listener(model_class, identity), ...]
+_write_listeners = dict()
+
+# table name => version, bumped on every write through QueryMixin
+_table_versions = dict()
+_table_versions_lock = threading.Lock()
+_NO_RESULT = object()
+# (model, conjunction, operator, kwarg names, None kwargs) => filter criterion, see _statement_shape
+_statement_shapes = dict()
+# execution options of read helper queries, see project.db.RoutingSession
+_READ_REPLICA = {REPLICA_OPTION: True}
+# session.info key holding the writes of the open `transaction`
+_TRANSACTION_KEY = 'query_mixin_transaction'
+# bind parameters allowed in one statement (SQLite before 3.32 allowed only 999)
+_MAX_BIND_PARAMS = {'postgresql': 32767, 'sqlite': 999}
+
+
+def _sizeof_result(value):
+    """Approximate bytes held by a cached result (rows are dicts of column values)."""
+    rows = value if isinstance(value, list) else [value]
+    size = sys.getsizeof(value)
+    for row in rows:
+        if isinstance(row, dict):
+            size += sys.getsizeof(row) + sum(sys.getsizeof(item) for item in row.values())
+    return size
+
+
+# process wide result cache for the read helpers, configured in create_app
+result_cache = LRUCache(maxsize=1024, ttl=30, maxbytes=8 * 1024 * 1024, sizeof=_sizeof_result)
+metrics.register_gauge('db.result_cache', lambda: result_cache.stats)
+
+
+@contextmanager
+def transaction(expire_on_commit=True):
+    """Unit of work: writes made through QueryMixin (save, delete, update,
+    bulk_*) inside the block are only flushed, and committed once on exit.
+
+    Example:
+
+        with transaction(expire_on_commit=False):
+            for profile, data in changes:
+                results.append(profile.update(data))
+
+    Any exception rolls the whole block back. Nested blocks join the
+    outermost one. With expire_on_commit=False instances keep their loaded
+    state after the commit, so serializing them afterwards issues no SELECT.
+
+    Yields the session.
+    """
+    session = db.session()
+    if _TRANSACTION_KEY in session.info:
+        yield session
+        return
+    pending = session.info[_TRANSACTION_KEY] = []
+    expire = session.expire_on_commit
+    try:
+        yield session
+        session.expire_on_commit = expire_on_commit
+        session.commit()
+    except BaseException:
+        session.rollback()
+        raise
+    finally:
+        session.expire_on_commit = expire
+        del session.info[_TRANSACTION_KEY]
+        for model, identity in pending:
+            model._notify_write(identity)
+
+
+class CachedQuery(BaseQuery):
+    """BaseQuery whose `all()` is served from `result_cache` when the query
+    was built by `QueryMixin.find` on a model with `__cache_results__` set.
+
+    Refining the query (filter, order_by, limit, ...) drops the cache key, so
+    only the exact query handed out by `find` is ever cached.
+    """
+    _result_cache_key = None
+
+    def _generate(self):
+        query = super()._generate()
+        query._result_cache_key = None
+        return query
+
+    def all(self):
+        if self._result_cache_key is None:
+            return super().all()
+        model = self.column_descriptions[0]['entity']
+        rows = result_cache.get(self._result_cache_key, _NO_RESULT)
+        if rows is _NO_RESULT:
+            items = super().all()
+            result_cache.set(self._result_cache_key, [item.to_row() for item in items])
+            return items
+        return [model.from_row(row) for row in rows]
+
+    def __iter__(self):
+        if self._result_cache_key is None:
+            return super().__iter__()
+        return iter(self.all())
 
 
 class QueryMixin(object):
@@ -30,12 +144,130 @@ class QueryMixin(object):
     def save(self):
         """Save instance to database."""
         db.session.add(self)
-        db.session.commit()
+        db.session.flush()
+        self._commit(inspect(self).identity)
 
     def delete(self):
         """Delete instance."""
+        identity = inspect(self).identity
         db.session.delete(self)
-        db.session.commit()
+        self._commit(identity)
+
+    # Bulk methods
+    @classmethod
+    def bulk_insert(cls, rows, batch_size=1000):
+        """Insert dictionaries of column values, `batch_size` rows per executemany.
+
+        Every row must carry the same keys. Column defaults still apply.
+
+        Returns number of rows inserted.
+        """
+        count = 0
+        for chunk in _chunks(rows, batch_size):
+            db.session.execute(cls.__table__.insert(), chunk)
+            count += len(chunk)
+        cls._commit(None)
+        return count
+
+    @classmethod
+    def bulk_upsert(cls, rows, key, update=None, batch_size=1000):
+        """Insert rows, updating those that collide on the unique column `key`.
+
+        Example:
+
+            UserProfile.bulk_upsert(rows, key='alternate_id')
+
+        `update` lists the columns overwritten on conflict, defaulting to every
+        key of the first row except `key` and the primary key. Every row must
+        carry the same keys. Uses one multi-row INSERT .. ON CONFLICT per chunk
+        on PostgreSQL and SQLite, and falls back to an UPDATE or INSERT per
+        row elsewhere.
+
+        Returns number of rows inserted or updated; rows skipped by
+        ON CONFLICT DO NOTHING (empty `update`) are not counted.
+        """
+        rows = list(rows)
+        if not rows:
+            return 0
+        table = cls.__table__
+        primary_keys = {column.key for column in table.primary_key}
+        if update is None:
+            update = [name for name in rows[0] if name != key and name not in primary_keys]
+        dialect = db.engine.dialect
+        insert = {'postgresql': postgresql.insert, 'sqlite': sqlite.insert}.get(dialect.name)
+        if insert is None:
+            return cls._bulk_upsert_rows(rows, key, update)
+
+        def upsert(chunk):
+            stmt = insert(table).values(chunk)
+            if not update:
+                return stmt.on_conflict_do_nothing(index_elements=[table.c[key]])
+            set_ = {name: stmt.excluded[name] for name in update}
+            if 'version' in table.c:
+                set_['version'] = table.c.version + 1
+            return stmt.on_conflict_do_update(index_elements=[table.c[key]], set_=set_)
+
+        # one statement per chunk so rowcount is exact; executemany only
+        # reports the last page on psycopg2. Python-side column defaults are
+        # bound per row too, so size chunks from the compiled statement.
+        per_row = len(insert(table).values(rows[:1]).compile(dialect=dialect).params)
+        per_statement = len(upsert(rows[:1]).compile(dialect=dialect).params) - per_row
+        batch_size = max(1, min(batch_size, (_MAX_BIND_PARAMS[dialect.name] - per_statement) // per_row))
+        count = 0
+        for chunk in _chunks(rows, batch_size):
+            count += db.session.execute(upsert(chunk)).rowcount
+        cls._commit(None)
+        return count
+
+    @classmethod
+    def bulk_delete(cls, *criteria, batch_size=1000, **kwargs):
+        """Delete every row matching the AND of criteria and kwargs,
+        `batch_size` rows per transaction.
+
+        Example:
+
+            # delete all instances of MyModel for locale 'en'
+            MyModel.bulk_delete(locale='en')
+            # criteria may be any SQLAlchemy filter expression
+            MyModel.bulk_delete(MyModel.email.endswith('@example.com'))
+
+        Returns number of rows deleted.
+        Raises ValueError without criteria or kwargs, rather than emptying
+        the table.
+        """
+        primary_key = inspect(cls).primary_key[0]
+        filters = list(criteria) + cls._filters(kwargs)
+        if not filters:
+            raise ValueError(f'{cls.__name__}.bulk_delete needs criteria or kwargs')
+        count = 0
+        while True:
+            ids = [row[0] for row in db.session.query(primary_key)
+                   .filter(db.and_(*filters))
+                   .limit(batch_size)]
+            if not ids:
+                break
+            count += db.session.query(cls).filter(primary_key.in_(ids)).delete(synchronize_session=False)
+            cls._commit(*[(id,) for id in ids])
+        return count
+
+    # Opt in to serving exists/find/first/get from `result_cache`. Only writes made
+    # through QueryMixin (save, delete, update, bulk_*) invalidate cached results,
+    # and only in the process that made them: writes by other gunicorn workers or
+    # other clients are seen once the cache ttl expires. Opt in only for models
+    # that tolerate reads that are stale by up to DATABASE_RESULT_CACHE_TTL.
+    __cache_results__ = False
+
+    # Write hooks
+    @classmethod
+    def on_write(cls, listener):
+        """Register `listener(model_class, identity)` to run after an instance
+        of this model (or a subclass) is saved, updated or deleted.
+
+        `identity` is the primary key tuple, or None after a bulk write that
+        may have touched any row. Usable as a decorator.
+        """
+        _write_listeners.setdefault(cls, []).append(listener)
+        return listener
 
     # Query helpers
     @classmethod
@@ -44,7 +276,22 @@ class QueryMixin(object):
 
         Returns True/False.
         """
-        return db.session.query(cls._and_query(kwargs).exists()).all()[0][0]
+        return cls._cached('exists', kwargs,
+                           lambda: db.session.query(cls._and_query(kwargs).exists()).execution_options(**_READ_REPLICA).scalar())
+
+    @classmethod
+    def exists_many(cls, ids, batch_size=1000):
+        """Checks which of the primary keys `ids` exist in the database,
+        with one IN query per `batch_size` ids.
+
+        Returns set of present ids.
+        """
+        primary_key = inspect(cls).primary_key[0]
+        present = set()
+        for chunk in _chunks(set(ids), batch_size):
+            present.update(row[0] for row in db.session.query(primary_key).filter(primary_key.in_(chunk))
+                           .execution_options(**_READ_REPLICA))
+        return present
 
     @classmethod
     def find(cls, **kwargs):
@@ -57,7 +304,11 @@ class QueryMixin(object):
 
         Returns result list or None.
         """
-        return cls._and_query(kwargs)
+        query = cls._and_query(kwargs)
+        key = cls._result_cache_key('find', kwargs)
+        if key is not None:
+            query._result_cache_key = key
+        return query
 
     @classmethod
     def find_or(cls, **kwargs):
@@ -117,7 +368,7 @@ class QueryMixin(object):
         Returns result list or None.
         """
         filters = [getattr(cls, attr) != None for attr in args]
-        return cls.query.filter(*filters)
+        return cls._read_query().filter(*filters)
 
     @classmethod
     def first(cls, **kwargs):
@@ -125,7 +376,7 @@ class QueryMixin(object):
 
         Returns instance or None.
         """
-        return cls._and_query(kwargs).first()
+        return cls._cached_instance('first', kwargs, lambda: cls._and_query(kwargs).first())
 
     @classmethod
     def first_or_404(cls, **kwargs):
@@ -136,18 +387,135 @@ class QueryMixin(object):
         else:
             return item
 
+    @classmethod
+    def find_page(cls, cursor=None, limit=50, order_by='id', descending=False, **kwargs):
+        """Return one keyset (seek) page of the AND query for passed in kwargs.
+
+        Rows are ordered by (`order_by`, primary key), so `order_by` should be
+        an indexed column such as `id` or `created_at`. Pass the returned
+        cursor back to get the following page; unlike OFFSET the cost of a
+        page does not grow with its depth.
+
+        Example:
+
+            items, cursor = MyModel.find_page(limit=100, order_by='created_at')
+            while cursor:
+                items, cursor = MyModel.find_page(cursor, limit=100, order_by='created_at')
+
+        Returns (result list, opaque cursor string or None on the last page).
+        Raises ValueError for a cursor issued for another ordering.
+        """
+        column = getattr(cls, order_by)
+        primary_key = inspect(cls).primary_key[0]
+        query = cls._and_query(kwargs)
+        if cursor:
+            value, last_id = _decode_cursor(cursor, order_by, descending)
+            order_column = column.property.columns[0]
+            if order_column is primary_key:
+                keyset, after = primary_key, last_id
+            else:
+                # bind the cursor value with the column type so e.g. ArrowType coerces it
+                keyset, after = tuple_(order_column, primary_key), tuple_(literal(value, order_column.type), last_id)
+            query = query.filter(keyset < after if descending else keyset > after)
+        if descending:
+            query = query.order_by(column.desc(), primary_key.desc())
+        else:
+            query = query.order_by(column, primary_key)
+        items = query.limit(limit + 1).all()
+        if len(items) <= limit:
+            return items, None
+        items = items[:limit]
+        last = items[-1]
+        return items, _encode_cursor(order_by, descending, getattr(last, order_by), inspect(last).identity[0])
+
+    @classmethod
+    def stream(cls, batch_size=1000, **kwargs):
+        """Iterate over every result of the AND query for passed in kwargs.
+
+        Uses a server-side cursor and loads `batch_size` rows at a time, so
+        full-table scans run in constant memory. Do not commit the session
+        while iterating.
+
+        Yields instances.
+        """
+        query = cls._and_query(kwargs).execution_options(stream_results=True).yield_per(batch_size)
+        for item in query:
+            yield item
+
     @classmethod
     def get(cls, id):
         """Get item by primary key.
 
         Returns instance or `None`.
         """
-        return cls.query.get(id)
+        return cls._cached_instance('get', {'id': id}, lambda: cls._read_query().get(id))
+
+    @classmethod
+    def get_many(cls, ids, batch_size=1000):
+        """Get items by primary key.
+
+        Instances already in the session identity map are reused; the rest
+        are loaded with one IN query per `batch_size` ids.
+
+        Example:
+
+            profiles = UserProfile.get_many([3, 1, 42])
+
+        Ids are coerced to the primary key's Python type first, so ids parsed
+        from a URL or JSON as strings find their rows.
+
+        Returns list in the order of `ids`, with `None` for missing ids.
+        """
+        mapper = inspect(cls)
+        primary_key = mapper.primary_key[0]
+        ids = [_coerce_id(primary_key, id) for id in ids]
+        found = dict()
+        missing = set()
+        for id in ids:
+            if id is None:
+                continue
+            instance = db.session.identity_map.get(mapper.identity_key_from_primary_key([id]))
+            if instance is not None:
+                found[id] = instance
+            else:
+                missing.add(id)
+        for chunk in _chunks(missing, batch_size):
+            for instance in cls._read_query().filter(primary_key.in_(chunk)):
+                found[inspect(instance).identity[0]] = instance
+        return [found.get(id) for id in ids]
+
+    def to_row(self):
+        """Return a dict of this instance's column values, see `from_row`."""
+        return {column.key: getattr(self, column.key) for column in inspect(type(self)).column_attrs}
+
+    @classmethod
+    def from_row(cls, row):
+        """Attach an instance built from a mapping of column values.
+
+        The row must hold every column of the table. No SELECT is issued. An
+        instance already in the session identity map is reused, and refreshed
+        from the row when the row is newer (a higher `version`, or always for
+        models without one) unless it holds unflushed changes.
+
+        Returns persistent instance.
+        """
+        mapper = inspect(cls)
+        key = mapper.identity_key_from_primary_key([row[column.key] for column in mapper.primary_key])
+        instance = db.session.identity_map.get(key)
+        if instance is not None:
+            state = inspect(instance)
+            if not state.modified and _row_is_newer(state, row):
+                for attr in mapper.column_attrs:
+                    set_committed_value(instance, attr.key, row[attr.key])
+            return instance
+        instance = cls(**dict(row))
+        make_transient_to_detached(instance)
+        return db.session.merge(instance, load=False)
 
     @classmethod
     def get_active_or_404(cls, id):
         """Get item by primary key or 404 only if it is active."""
-        item = cls.query.get_or_404(id)
+        item = cls._read_query().get_or_404(id)
         if item.active:
             return item
         else:
@@ -156,11 +524,105 @@ class QueryMixin(object):
     @classmethod
     def get_or_404(cls, id):
         """Get item by primary key or 404."""
-        return cls.query.get_or_404(id)
+        return cls._read_query().get_or_404(id)
 
     ########################################
     # Internal methods; Do not use directly
     ########################################
+    @classmethod
+    def _bulk_upsert_rows(cls, rows, key, update):
+        """`bulk_upsert` for dialects without INSERT .. ON CONFLICT: one UPDATE,
+        or INSERT for a new key, per row.
+
+        Returns sum of the statements' rowcounts.
+        """
+        table = cls.__table__
+        count = 0
+        for row in rows:
+            present = db.session.query(table.c[key]).filter(table.c[key] == row[key]).first() is not None
+            if not present:
+                count += db.session.execute(table.insert().values(row)).rowcount
+            elif update:
+                values = {name: row[name] for name in update}
+                if 'version' in table.c:
+                    values['version'] = table.c.version + 1
+                count += db.session.execute(table.update().where(table.c[key] == row[key]).values(values)).rowcount
+        cls._commit(None)
+        return count
+
+    @classmethod
+    def _read_query(cls):
+        """Return cls.query, routed to a read replica when any are configured."""
+        return cls.query.execution_options(**_READ_REPLICA)
+
+    @classmethod
+    def _commit(cls, *identities):
+        """Commit and notify write listeners, or inside `transaction` only
+        flush and leave both to the end of the transaction.
+        """
+        session = db.session()
+        pending = session.info.get(_TRANSACTION_KEY)
+        if pending is None:
+            session.commit()
+            for identity in identities:
+                cls._notify_write(identity)
+            return
+        session.flush()
+        for identity in identities:
+            # invalidate cached results now so this session never reads its own stale rows
+            _bump_table_version(cls, identity)
+            pending.append((cls, identity))
+
+    @classmethod
+    def _result_cache_key(cls, helper, kwargs):
+        """Return the result cache key for a read helper call, or None when
+        the model does not opt in or a filter value is unhashable.
+        """
+        if not cls.__cache_results__:
+            return None
+        table = cls.__table__.name
+        key = (table, cls.__name__, helper, tuple(sorted(kwargs.items())), _table_versions.get(table, 0))
+        try:
+            hash(key)
+        except TypeError:
+            return None
+        return key
+
+    @classmethod
+    def _cached(cls, helper, kwargs, load):
+        """Return `load()` through the result cache."""
+        key = cls._result_cache_key(helper, kwargs)
+        if key is None:
+            return load()
+        value = result_cache.get(key, _NO_RESULT)
+        if value is _NO_RESULT:
+            value = load()
+            result_cache.set(key, value)
+        return value
+
+    @classmethod
+    def _cached_instance(cls, helper, kwargs, load):
+        """Return the instance (or None) from `load()` through the result cache,
+        storing its column values rather than the session bound instance.
+        """
+        key = cls._result_cache_key(helper, kwargs)
+        if key is None:
+            return load()
+        row = result_cache.get(key, _NO_RESULT)
+        if row is _NO_RESULT:
+            instance = load()
+            result_cache.set(key, None if instance is None else instance.to_row())
+            return instance
+        return None if row is None else cls.from_row(row)
+
+    @classmethod
+    def _notify_write(cls, identity):
+        """Run the write listeners registered on this model and its bases."""
+        use_primary()
+        for klass in cls.__mro__:
+            for listener in _write_listeners.get(klass, ()):
+                listener(cls, identity)
+
     @classmethod
     def _filters(cls, filters):
         """Return filter list from kwargs."""
@@ -176,13 +638,55 @@ class QueryMixin(object):
         """Return NOT IN filter list from kwargs."""
         return [getattr(cls, attr).notin_(filters[attr]) for attr in filters]
 
+    @classmethod
+    def _statement_shape(cls, conjunction, operator, filters):
+        """Return the filter criterion for `filters` with every value as a
+        bound parameter, built once per (model, helper, kwarg names).
+
+        Equality against None compiles to IS NULL, so which kwargs are None is
+        part of the shape. Returns None for no filters.
+        """
+        if not filters:
+            return None
+        nulls = frozenset(attr for attr, value in filters.items() if value is None) if operator == 'eq' else frozenset()
+        key = (cls, conjunction.__name__, operator, tuple(sorted(filters)), nulls)
+        criterion = _statement_shapes.get(key)
+        if criterion is None:
+            clauses = list()
+            for attr in key[3]:
+                column = getattr(cls, attr)
+                if attr in nulls:
+                    clauses.append(column.is_(None))
+                elif operator == 'eq':
+                    clauses.append(column == bindparam(_param_name(attr)))
+                elif operator == 'in':
+                    clauses.append(column.in_(bindparam(_param_name(attr), expanding=True)))
+                else:
+                    clauses.append(column.notin_(bindparam(_param_name(attr), expanding=True)))
+            criterion = _statement_shapes.setdefault(key, conjunction(*clauses))
+        return criterion
+
+    @classmethod
+    def _shaped_query(cls, conjunction, operator, filters):
+        """Return read query filtered by the cached statement shape with the
+        values of `filters` bound.
+
+        Returns BaseQuery.
+        """
+        query = cls._read_query()
+        criterion = cls._statement_shape(conjunction, operator, filters)
+        if criterion is None:
+            return query
+        params = {_param_name(attr): value for attr, value in filters.items() if value is not None}
+        return query.filter(criterion).params(params)
+
     @classmethod
     def _and_query(cls, filters):
         """Execute AND query.
 
         Returns BaseQuery.
         """
-        return cls.query.filter(db.and_(*cls._filters(filters)))
+        return cls._shaped_query(db.and_, 'eq', filters)
 
     @classmethod
     def _and_in_query(cls, filters):
@@ -190,7 +694,7 @@ class QueryMixin(object):
 
         Returns BaseQuery.
         """
-        return cls.query.filter(db.and_(*cls._filters_in(filters)))
+        return cls._shaped_query(db.and_, 'in', filters)
 
     @classmethod
     def _and_not_in_query(cls, filters):
@@ -198,7 +702,7 @@ class QueryMixin(object):
 
         Returns BaseQuery.
         """
-        return cls.query.filter(db.and_(*cls._filters_not_in(filters)))
+        return cls._shaped_query(db.and_, 'not_in', filters)
 
     @classmethod
     def _or_query(cls, filters):
@@ -206,7 +710,7 @@ class QueryMixin(object):
 
         Returns BaseQuery.
         """
-        return cls.query.filter(db.or_(*cls._filters(filters)))
+        return cls._shaped_query(db.or_, 'eq', filters)
 
     @classmethod
     def _or_in_query(cls, filters):
@@ -214,7 +718,7 @@ class QueryMixin(object):
 
         Returns BaseQuery.
         """
-        return cls.query.filter(db.or_(*cls._filters_in(filters)))
+        return cls._shaped_query(db.or_, 'in', filters)
 
     @classmethod
     def _or_not_in_query(cls, filters):
@@ -222,4 +726,78 @@ class QueryMixin(object):
 
         Returns BaseQuery.
         """
-        return cls.query.filter(db.or_(*cls._filters_not_in(filters)))
+        return cls._shaped_query(db.or_, 'not_in', filters)
+
+
+def reset_after_fork():
+    """Re-initialize the result cache in a worker forked from a preloaded app."""
+    global _table_versions_lock
+    _table_versions_lock = threading.Lock()
+    result_cache.after_fork()
+
+
+@QueryMixin.on_write
+def _bump_table_version(model, identity):
+    """Invalidate every cached result for the written model's table."""
+    table = model.__table__.name
+    with _table_versions_lock:
+        _table_versions[table] = _table_versions.get(table, 0) + 1
+
+
+def _encode_cursor(order_by, descending, value, id):
+    """Opaque keyset cursor, see `QueryMixin.find_page`."""
+    if hasattr(value, 'isoformat'):
+        value = value.isoformat()
+    data = json.dumps([order_by, descending, value, id], separators=(',', ':'))
+    return urlsafe_b64encode(data.encode('utf-8')).decode('ascii')
+
+
+def _decode_cursor(cursor, order_by, descending):
+    """Return the (value, id) of a cursor issued for the same ordering."""
+    try:
+        cursor_order_by, cursor_descending, value, id = json.loads(urlsafe_b64decode(cursor.encode('ascii')))
+    except (TypeError, ValueError) as e:
+        raise ValueError(f'Invalid cursor: {cursor}')
+    if cursor_order_by != order_by or cursor_descending != descending:
+        raise ValueError(f'Cursor was issued for ordering by {cursor_order_by}')
+    return value, id
+
+
+def _param_name(attr):
+    """Bound parameter name of a filter kwarg in a statement shape."""
+    return f'qm_{attr}'
+
+
+def _coerce_id(column, id):
+    """`id` as the Python type of the primary key `column`, or None when it
+    cannot be one (so no row can match it).
+    """
+    try:
+        python_type = column.type.python_type
+    except NotImplementedError:
+        return id
+    if id is None or isinstance(id, python_type):
+        return id
+    try:
+        return python_type(id)
+    except (TypeError, ValueError):
+        return None
+
+
+def _row_is_newer(state, row):
+    """Whether `row` holds newer column values than the instance `state`."""
+    if 'version' not in state.mapper.column_attrs or 'version' not in row:
+        return True
+    if 'version' not in state.dict:
+        # expired, the next access reloads it from the database
+        return False
+    return (row['version'] or 0) > (state.dict['version'] or 0)
+
+
+def _chunks(iterable, size):
+    """Yield lists of at most `size` items."""
+    iterator = iter(iterable)
+    chunk = list(islice(iterator, size))
+    while chunk:
+        yield chunk
+        chunk = list(islice(iterator, size))
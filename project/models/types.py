@@ -0,0 +1,17 @@
+"""
+Column types shared by the models.
+"""
+
+from sqlalchemy_utils import ArrowType as _ArrowType
+
+
+__all__ = ('ArrowType', )
+
+
+class ArrowType(_ArrowType):
+    """sqlalchemy_utils ArrowType marked safe for SQLAlchemy's statement cache.
+
+    The upstream type does not set `cache_ok`, which stops SQLAlchemy from
+    caching the compiled form of any statement touching an Arrow column.
+    """
+    cache_ok = True
@@ -1,8 +1,12 @@
 from flask_login import UserMixin
+from sqlalchemy import literal, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.exc import IntegrityError
 from .base import Model
 from project.db import db
+from project.lib.concurrency import KeyedLocks
 from project.setup.loggers import LOGGERS
-from sqlalchemy_utils import ArrowType
+from .types import ArrowType
 from arrow import utcnow
 
 __all__ = ('UserProfile', )
@@ -11,6 +15,15 @@ __all__ = ('UserProfile', )
 log = LOGGERS.Database
 
 
+# serializes first logins for the same subject within this process
+_creating = KeyedLocks()
+
+
+def reset_after_fork():
+    """Drop get_or_create locks inherited from the parent process."""
+    _creating.after_fork()
+
+
 class UserProfile(UserMixin, Model):
     """
     .base.Model provides:
@@ -18,7 +31,6 @@ class UserProfile(UserMixin, Model):
         created_at (creation date)
     flask_login.UserMixin provides:
     """
-
     alternate_id = db.Column(db.String(256), nullable=False, unique=True)
     social_id = db.Column(db.String(256), nullable=True, unique=True)
     nickname = db.Column(db.String(256), nullable=True)
@@ -66,13 +78,57 @@ class UserProfile(UserMixin, Model):
 
     @classmethod
     def get_or_create(cls, sub):
-        existing_user = cls.query.filter(cls.alternate_id == sub).one_or_none()
-        if existing_user:
-            return existing_user
-        else:
-            new_user = cls(alternate_id=sub)
-            new_user.save()
-            this_id = new_user.id
-            db.session.close()
-            initialized_user = cls.get(this_id)
-            return initialized_user
+        """
+        Return the profile for `sub`, creating it if needed.
+
+        On PostgreSQL this is a single statement:
+            WITH ins AS (INSERT .. ON CONFLICT DO NOTHING RETURNING *)
+            SELECT * FROM ins UNION ALL SELECT * FROM userprofile WHERE alternate_id = :sub
+        so existing rows are not rewritten. Other databases fall back to
+        SELECT / INSERT in a savepoint. Concurrent callers for the same `sub`
+        in this process are coalesced. Write listeners only run when a row
+        was actually inserted.
+        """
+        with _creating.hold(sub):
+            with db.engine.begin() as connection:
+                if connection.dialect.name == 'postgresql':
+                    row, created = cls._upsert_returning(connection, sub)
+                else:
+                    row, created = cls._select_or_insert(connection, sub)
+            if created:
+                cls._notify_write((row['id'],))
+            return cls.from_row(row)
+
+    @classmethod
+    def _upsert_returning(cls, connection, sub):
+        table = cls.__table__
+        inserted = pg_insert(table).values(alternate_id=sub) \
+            .on_conflict_do_nothing(index_elements=[table.c.alternate_id]) \
+            .returning(*table.c) \
+            .cte('inserted')
+        stmt = select(*inserted.c, literal(True).label('created')) \
+            .union_all(select(*table.c, literal(False).label('created')).where(table.c.alternate_id == sub)) \
+            .limit(1)
+        row = connection.execute(stmt).first()
+        if row is None:
+            # a concurrent insert committed after this statement's snapshot was taken
+            row = connection.execute(select(*table.c).where(table.c.alternate_id == sub)).first()
+            return dict(row._mapping), False
+        row = dict(row._mapping)
+        return row, row.pop('created')
+
+    @classmethod
+    def _select_or_insert(cls, connection, sub):
+        table = cls.__table__
+        query = select(*table.c).where(table.c.alternate_id == sub)
+        row = connection.execute(query).first()
+        created = False
+        if row is None:
+            try:
+                with connection.begin_nested():
+                    connection.execute(table.insert().values(alternate_id=sub))
+                created = True
+            except IntegrityError:
+                log.debug('get_or_create: lost insert race for %s', sub)
+            row = connection.execute(query).first()
+        return dict(row._mapping), created
@@ -2,6 +2,7 @@ from flask import redirect, url_for, flash, session, request, render_template, j
 from flask_login import login_user, logout_user, current_user, login_required
 
 from project.setup.loggers import LOGGERS
+from project.lib.metrics import metrics
 from project.auth import requires_sign_in, AuthError
 from project.models.base import ApiDatabaseError
 
@@ -24,6 +25,7 @@ def init_routes(app=None):
     # Handle HTTP errors
     register_frontend_handlers(app)
     register_api_handlers(app)
+    register_metrics_handlers(app)
     register_error_handlers(app)
 
 
@@ -36,6 +38,23 @@ def register_api_handlers(app=None):
         raise ValueError('cannot register error handlers on an empty app')
 
 
+def register_metrics_handlers(app=None):
+    """Register the in-process metrics dump when METRICS_ENDPOINT is enabled.
+
+    Raises error if app is not provided.
+    """
+    if app is None:
+        raise ValueError('cannot register metrics handlers on an empty app')
+
+    if not app.config['SETUP'].METRICS_ENDPOINT:
+        return
+
+    @app.route('/metrics')
+    @app.route('/metrics/')
+    def metrics_dump():
+        return jsonify(metrics.snapshot())
+
+
 def register_frontend_handlers(app=None):
     """Register app frontend handlers.
 
@@ -1,13 +1,18 @@
 import os
 import json
+import logging
 import sys
 import platform
 import yaml
+from hashlib import sha256
 from pathlib import Path
 from functools import wraps
+from types import MappingProxyType
 from project.setup.loggers import LOGGERS
 
 log = LOGGERS.Setup
+# libyaml's loader when available, the safe loader is all config files need
+YAML_LOADER = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
 
 
 def show_func_name(func):
@@ -34,7 +39,25 @@ class SetupConfig:
         self.__properties['AUTH0_API_AUDIENCE'] = self.__init_auth0_api_audience()
         self.__properties['AUTH0_CLIENT_ID'] = self.__init_auth0_client_id()
         self.__properties['AUTH0_CALLBACK_URL'] = self.__init_auth0_callback_url()
+        self.__properties['AUTH0_JWKS_TTL'] = self.__init_auth0_jwks_ttl()
+        self.__properties['AUTH0_JWKS_MIN_REFRESH'] = self.__init_auth0_jwks_min_refresh()
+        self.__properties['AUTH0_USERINFO_FRESHNESS'] = self.__init_auth0_userinfo_freshness()
+        self.__properties['AUTH0_USERINFO_STALE'] = self.__init_auth0_userinfo_stale()
+        self.__properties['AUTH_LATENCY_BUDGET'] = self.__init_auth_latency_budget()
+        self.__properties['HTTP_CONNECT_TIMEOUT'] = self.__init_http_connect_timeout()
+        self.__properties['HTTP_READ_TIMEOUT'] = self.__init_http_read_timeout()
+        self.__properties['HTTP_POOL_SIZE'] = self.__init_http_pool_size()
+        self.__properties['HTTP_BREAKER_THRESHOLD'] = self.__init_http_breaker_threshold()
+        self.__properties['HTTP_BREAKER_RESET'] = self.__init_http_breaker_reset()
         self.__properties['JWT_SECRET'] = self.__init_jwt_secret()
+        self.__properties['SERVICE_TOKEN_ISSUER'] = self.__init_service_token_issuer()
+        self.__properties['SERVICE_TOKEN_KEYS'] = self.__init_service_token_keys()
+        self.__properties['SERVICE_TOKEN_ALGORITHM'] = self.__init_service_token_algorithm()
+        self.__properties['SERVICE_TOKEN_TTL'] = self.__init_service_token_ttl()
+        self.__properties['AUTH_TOKEN_CACHE_SIZE'] = self.__init_auth_token_cache_size()
+        self.__properties['AUTH_TOKEN_CACHE_TTL'] = self.__init_auth_token_cache_ttl()
+        self.__properties['AUTH_USER_CACHE_SIZE'] = self.__init_auth_user_cache_size()
+        self.__properties['AUTH_USER_CACHE_TTL'] = self.__init_auth_user_cache_ttl()
         self.__properties['APP_MODE'] = self.__init_mode()
         self.__properties['HOSTNAME'] = self.__init_host_name()
         self.__properties['USER_HOME'] = self.__init_user_home()
@@ -42,6 +65,32 @@ class SetupConfig:
         self.__properties['STATIC_FILES'] = self.__init_static_files()
         self.__properties['SECRET_KEY'] = self.__init_secret_key()
         self.__properties['DATABASE_URL'] = self.__init_db_uri()
+        self.__properties['MODEL_MANIFEST'] = self.__init_model_manifest()
+        self.__properties['DATABASE_REPLICA_URLS'] = self.__init_db_replica_uris()
+        self.__properties['METRICS_SERVER_TIMING'] = self.__init_metrics_server_timing()
+        self.__properties['METRICS_ENDPOINT'] = self.__init_metrics_endpoint()
+        self.__properties['SQL_PROFILE_ENABLED'] = self.__init_sql_profile_enabled()
+        self.__properties['SQL_PROFILE_HEADER'] = self.__init_sql_profile_header()
+        self.__properties['SQL_PROFILE_SLOW_REQUEST'] = self.__init_sql_profile_slow_request()
+        self.__properties['SQL_PROFILE_N_PLUS_ONE'] = self.__init_sql_profile_n_plus_one()
+        self.__properties['SQL_PROFILE_TOP'] = self.__init_sql_profile_top()
+        self.__properties['DATABASE_RESULT_CACHE_SIZE'] = self.__init_database_result_cache_size()
+        self.__properties['DATABASE_RESULT_CACHE_BYTES'] = self.__init_database_result_cache_bytes()
+        self.__properties['DATABASE_RESULT_CACHE_TTL'] = self.__init_database_result_cache_ttl()
+        self.__properties['DATABASE_POOL_SIZE'] = self.__init_database_pool_size()
+        self.__properties['DATABASE_MAX_OVERFLOW'] = self.__init_database_max_overflow()
+        self.__properties['DATABASE_POOL_TIMEOUT'] = self.__init_database_pool_timeout()
+        self.__properties['DATABASE_POOL_RECYCLE'] = self.__init_database_pool_recycle()
+        self.__properties['DATABASE_POOL_PRE_PING'] = self.__init_database_pool_pre_ping()
+        self.__properties['DATABASE_STATEMENT_TIMEOUT'] = self.__init_database_statement_timeout()
+        self.__properties['GUNICORN_WORKERS'] = self.__init_gunicorn_workers()
+        self.__properties['GUNICORN_WORKER_CLASS'] = self.__init_gunicorn_worker_class()
+        self.__properties['GUNICORN_THREADS'] = self.__init_gunicorn_threads()
+        self.__properties['GUNICORN_TIMEOUT'] = self.__init_gunicorn_timeout()
+        self.__properties['GUNICORN_PRELOAD'] = self.__init_gunicorn_preload()
+        self.__properties['GUNICORN_MAX_REQUESTS'] = self.__init_gunicorn_max_requests()
+        self.__properties['GUNICORN_MAX_REQUESTS_JITTER'] = self.__init_gunicorn_max_requests_jitter()
+        self.__properties['AUTH0_USERINFO_URLS'] = self.__init_auth0_userinfo_urls()
 
     @property
     def ROOT(self):
@@ -68,9 +117,10 @@ class SetupConfig:
         data = dict()
         if os.path.isfile(config_yaml):
             with open(config_yaml) as f:
-                data = yaml.load(f, Loader=yaml.FullLoader)
+                data = yaml.load(f, Loader=YAML_LOADER)
                 log.debug('CONFIG: Successfully loaded')
-                log.debug(f'CONFIG: {json.dumps(data, indent=4)}')
+                if log.isEnabledFor(logging.DEBUG):
+                    log.debug(f'CONFIG: {json.dumps(data, indent=4, default=str)}')
                 return data
         else:
             # raise FileNotFoundError(f'{config_yaml} missing!')
@@ -87,9 +137,10 @@ class SetupConfig:
         data = dict()
         if os.path.isfile(database_info_yaml):
             with open(database_info_yaml) as f:
-                data = yaml.load(f, Loader=yaml.FullLoader)
+                data = yaml.load(f, Loader=YAML_LOADER)
                 log.debug('DATABASE_INFO: Successfully loaded')
-                log.debug(f'DATABASE_INFO: {json.dumps(data, indent=4)}')
+                if log.isEnabledFor(logging.DEBUG):
+                    log.debug(f'DATABASE_INFO: {json.dumps(data, indent=4, default=str)}')
                 return data
         else:
             # raise FileNotFoundError(f'{database_info_yaml} missing!')
@@ -216,6 +267,115 @@ class SetupConfig:
         log.debug(f'AUTH0_CALLBACK_URL: {callback_url}')
         return callback_url
 
+    @property
+    def AUTH0_JWKS_TTL(self):
+        return self.__properties['AUTH0_JWKS_TTL']
+
+    @show_func_name
+    def __init_auth0_jwks_ttl(self):
+        ttl = os.environ.get('JWKS_TTL')
+        if not ttl:
+            ttl = self.CONFIG.get('auth0', dict()).get('jwks_ttl', 600)
+        ttl = int(ttl)
+        log.debug(f'AUTH0_JWKS_TTL: {ttl}')
+        return ttl
+
+    @property
+    def AUTH0_JWKS_MIN_REFRESH(self):
+        return self.__properties['AUTH0_JWKS_MIN_REFRESH']
+
+    @show_func_name
+    def __init_auth0_jwks_min_refresh(self):
+        min_refresh = os.environ.get('JWKS_MIN_REFRESH')
+        if not min_refresh:
+            min_refresh = self.CONFIG.get('auth0', dict()).get('jwks_min_refresh', 30)
+        min_refresh = int(min_refresh)
+        log.debug(f'AUTH0_JWKS_MIN_REFRESH: {min_refresh}')
+        return min_refresh
+
+    @property
+    def AUTH0_USERINFO_FRESHNESS(self):
+        return self.__properties['AUTH0_USERINFO_FRESHNESS']
+
+    @show_func_name
+    def __init_auth0_userinfo_freshness(self):
+        freshness = os.environ.get('USERINFO_FRESHNESS')
+        if not freshness:
+            freshness = self.CONFIG.get('auth0', dict()).get('userinfo_freshness', 3600)
+        freshness = int(freshness)
+        log.debug(f'AUTH0_USERINFO_FRESHNESS: {freshness}')
+        return freshness
+
+    @property
+    def AUTH0_USERINFO_STALE(self):
+        return self.__properties['AUTH0_USERINFO_STALE']
+
+    @show_func_name
+    def __init_auth0_userinfo_stale(self):
+        stale = int(self.CONFIG.get('auth0', dict()).get('userinfo_stale', 86400))
+        log.debug(f'AUTH0_USERINFO_STALE: {stale}')
+        return stale
+
+    @property
+    def AUTH_LATENCY_BUDGET(self):
+        return self.__properties['AUTH_LATENCY_BUDGET']
+
+    @show_func_name
+    def __init_auth_latency_budget(self):
+        budget = float(self.CONFIG.get('auth0', dict()).get('latency_budget', 2.0))
+        log.debug(f'AUTH_LATENCY_BUDGET: {budget}')
+        return budget
+
+    @property
+    def HTTP_CONNECT_TIMEOUT(self):
+        return self.__properties['HTTP_CONNECT_TIMEOUT']
+
+    @show_func_name
+    def __init_http_connect_timeout(self):
+        timeout = float(self.CONFIG.get('http', dict()).get('connect_timeout', 3.05))
+        log.debug(f'HTTP_CONNECT_TIMEOUT: {timeout}')
+        return timeout
+
+    @property
+    def HTTP_READ_TIMEOUT(self):
+        return self.__properties['HTTP_READ_TIMEOUT']
+
+    @show_func_name
+    def __init_http_read_timeout(self):
+        timeout = float(self.CONFIG.get('http', dict()).get('read_timeout', 5.0))
+        log.debug(f'HTTP_READ_TIMEOUT: {timeout}')
+        return timeout
+
+    @property
+    def HTTP_POOL_SIZE(self):
+        return self.__properties['HTTP_POOL_SIZE']
+
+    @show_func_name
+    def __init_http_pool_size(self):
+        pool_size = int(self.CONFIG.get('http', dict()).get('pool_size', 10))
+        log.debug(f'HTTP_POOL_SIZE: {pool_size}')
+        return pool_size
+
+    @property
+    def HTTP_BREAKER_THRESHOLD(self):
+        return self.__properties['HTTP_BREAKER_THRESHOLD']
+
+    @show_func_name
+    def __init_http_breaker_threshold(self):
+        threshold = int(self.CONFIG.get('http', dict()).get('breaker_threshold', 5))
+        log.debug(f'HTTP_BREAKER_THRESHOLD: {threshold}')
+        return threshold
+
+    @property
+    def HTTP_BREAKER_RESET(self):
+        return self.__properties['HTTP_BREAKER_RESET']
+
+    @show_func_name
+    def __init_http_breaker_reset(self):
+        reset = float(self.CONFIG.get('http', dict()).get('breaker_reset', 30.0))
+        log.debug(f'HTTP_BREAKER_RESET: {reset}')
+        return reset
+
     @property
     def JWT_SECRET(self):
         return self.__properties['JWT_SECRET']
@@ -228,6 +388,95 @@ class SetupConfig:
         log.debug(f'JWT_SECRET: {jwt_secret}')
         return jwt_secret
 
+    @property
+    def SERVICE_TOKEN_ISSUER(self):
+        return self.__properties['SERVICE_TOKEN_ISSUER']
+
+    @show_func_name
+    def __init_service_token_issuer(self):
+        issuer = os.environ.get('SERVICE_TOKEN_ISSUER')
+        if not issuer:
+            issuer = self.CONFIG.get('service_tokens', dict()).get('issuer')
+        log.debug(f'SERVICE_TOKEN_ISSUER: {issuer}')
+        return issuer
+
+    @property
+    def SERVICE_TOKEN_KEYS(self):
+        return self.__properties['SERVICE_TOKEN_KEYS']
+
+    @show_func_name
+    def __init_service_token_keys(self):
+        """
+        kid => secret, from SERVICE_TOKEN_KEYS='kid1:secret1,kid2:secret2' or config.yaml
+        """
+        env_keys = os.environ.get('SERVICE_TOKEN_KEYS')
+        if env_keys:
+            keys = dict(item.split(':', 1) for item in env_keys.split(',') if item)
+        else:
+            keys = dict(self.CONFIG.get('service_tokens', dict()).get('keys') or dict())
+        log.debug(f'SERVICE_TOKEN_KEYS: {list(keys)}')
+        return keys
+
+    @property
+    def SERVICE_TOKEN_ALGORITHM(self):
+        return self.__properties['SERVICE_TOKEN_ALGORITHM']
+
+    @show_func_name
+    def __init_service_token_algorithm(self):
+        algorithm = self.CONFIG.get('service_tokens', dict()).get('algorithm', 'HS256')
+        log.debug(f'SERVICE_TOKEN_ALGORITHM: {algorithm}')
+        return algorithm
+
+    @property
+    def SERVICE_TOKEN_TTL(self):
+        return self.__properties['SERVICE_TOKEN_TTL']
+
+    @show_func_name
+    def __init_service_token_ttl(self):
+        ttl = int(self.CONFIG.get('service_tokens', dict()).get('ttl', 3600))
+        log.debug(f'SERVICE_TOKEN_TTL: {ttl}')
+        return ttl
+
+    @property
+    def AUTH_TOKEN_CACHE_SIZE(self):
+        return self.__properties['AUTH_TOKEN_CACHE_SIZE']
+
+    @show_func_name
+    def __init_auth_token_cache_size(self):
+        size = int(self.CONFIG.get('jwt', dict()).get('cache_size', 1024))
+        log.debug(f'AUTH_TOKEN_CACHE_SIZE: {size}')
+        return size
+
+    @property
+    def AUTH_TOKEN_CACHE_TTL(self):
+        return self.__properties['AUTH_TOKEN_CACHE_TTL']
+
+    @show_func_name
+    def __init_auth_token_cache_ttl(self):
+        ttl = int(self.CONFIG.get('jwt', dict()).get('cache_ttl', 300))
+        log.debug(f'AUTH_TOKEN_CACHE_TTL: {ttl}')
+        return ttl
+
+    @property
+    def AUTH_USER_CACHE_SIZE(self):
+        return self.__properties['AUTH_USER_CACHE_SIZE']
+
+    @show_func_name
+    def __init_auth_user_cache_size(self):
+        size = int(self.CONFIG.get('app', dict()).get('user_cache_size', 512))
+        log.debug(f'AUTH_USER_CACHE_SIZE: {size}')
+        return size
+
+    @property
+    def AUTH_USER_CACHE_TTL(self):
+        return self.__properties['AUTH_USER_CACHE_TTL']
+
+    @show_func_name
+    def __init_auth_user_cache_ttl(self):
+        ttl = int(self.CONFIG.get('app', dict()).get('user_cache_ttl', 60))
+        log.debug(f'AUTH_USER_CACHE_TTL: {ttl}')
+        return ttl
+
     @property
     def USER_HOME(self):
         return self.__properties['USER_HOME']
@@ -350,3 +599,407 @@ class SetupConfig:
             log.debug(f'DATABASE_URL: {database_path}')
             return database_path
 
+
+    @property
+    def MODEL_MANIFEST(self):
+        return self.__properties['MODEL_MANIFEST']
+
+    @show_func_name
+    def __init_model_manifest(self):
+        use_manifest = os.environ.get('MODEL_MANIFEST')
+        if use_manifest:
+            use_manifest = use_manifest.lower() not in ('0', 'false', 'no')
+        else:
+            use_manifest = bool(self.CONFIG.get('app', dict()).get('model_manifest', True))
+        log.debug(f'MODEL_MANIFEST: {use_manifest}')
+        return use_manifest
+
+    @property
+    def DATABASE_REPLICA_URLS(self):
+        return self.__properties['DATABASE_REPLICA_URLS']
+
+    @show_func_name
+    def __init_db_replica_uris(self):
+        env_urls = os.environ.get('DATABASE_REPLICA_URLS')
+        if env_urls:
+            urls = [url.strip() for url in env_urls.split(',') if url.strip()]
+        else:
+            urls = list(self.CONFIG.get('database', dict()).get('replica_urls', None) or [])
+        log.debug(f'DATABASE_REPLICA_URLS: {len(urls)} configured')
+        return urls
+
+    @property
+    def METRICS_SERVER_TIMING(self):
+        return self.__properties['METRICS_SERVER_TIMING']
+
+    @show_func_name
+    def __init_metrics_server_timing(self):
+        server_timing = bool(self.CONFIG.get('metrics', dict()).get('server_timing', False))
+        log.debug(f'METRICS_SERVER_TIMING: {server_timing}')
+        return server_timing
+
+    @property
+    def METRICS_ENDPOINT(self):
+        return self.__properties['METRICS_ENDPOINT']
+
+    @show_func_name
+    def __init_metrics_endpoint(self):
+        endpoint = bool(self.CONFIG.get('metrics', dict()).get('endpoint', False))
+        log.debug(f'METRICS_ENDPOINT: {endpoint}')
+        return endpoint
+
+    @property
+    def DATABASE_RESULT_CACHE_SIZE(self):
+        return self.__properties['DATABASE_RESULT_CACHE_SIZE']
+
+    @show_func_name
+    def __init_database_result_cache_size(self):
+        size = int(self.CONFIG.get('database', dict()).get('result_cache_size', 1024))
+        log.debug(f'DATABASE_RESULT_CACHE_SIZE: {size}')
+        return size
+
+    @property
+    def DATABASE_RESULT_CACHE_BYTES(self):
+        return self.__properties['DATABASE_RESULT_CACHE_BYTES']
+
+    @show_func_name
+    def __init_database_result_cache_bytes(self):
+        maxbytes = int(self.CONFIG.get('database', dict()).get('result_cache_bytes', 8 * 1024 * 1024))
+        log.debug(f'DATABASE_RESULT_CACHE_BYTES: {maxbytes}')
+        return maxbytes
+
+    @property
+    def DATABASE_RESULT_CACHE_TTL(self):
+        return self.__properties['DATABASE_RESULT_CACHE_TTL']
+
+    @show_func_name
+    def __init_database_result_cache_ttl(self):
+        ttl = int(self.CONFIG.get('database', dict()).get('result_cache_ttl', 30))
+        log.debug(f'DATABASE_RESULT_CACHE_TTL: {ttl}')
+        return ttl
+
+    @property
+    def DATABASE_POOL_SIZE(self):
+        return self.__properties['DATABASE_POOL_SIZE']
+
+    @show_func_name
+    def __init_database_pool_size(self):
+        size = os.environ.get('DATABASE_POOL_SIZE')
+        if not size:
+            size = self.CONFIG.get('database', dict()).get('pool_size', 5)
+        size = int(size)
+        log.debug(f'DATABASE_POOL_SIZE: {size}')
+        return size
+
+    @property
+    def DATABASE_MAX_OVERFLOW(self):
+        return self.__properties['DATABASE_MAX_OVERFLOW']
+
+    @show_func_name
+    def __init_database_max_overflow(self):
+        overflow = os.environ.get('DATABASE_MAX_OVERFLOW')
+        if not overflow:
+            overflow = self.CONFIG.get('database', dict()).get('max_overflow', 10)
+        overflow = int(overflow)
+        log.debug(f'DATABASE_MAX_OVERFLOW: {overflow}')
+        return overflow
+
+    @property
+    def DATABASE_POOL_TIMEOUT(self):
+        return self.__properties['DATABASE_POOL_TIMEOUT']
+
+    @show_func_name
+    def __init_database_pool_timeout(self):
+        timeout = float(self.CONFIG.get('database', dict()).get('pool_timeout', 30.0))
+        log.debug(f'DATABASE_POOL_TIMEOUT: {timeout}')
+        return timeout
+
+    @property
+    def DATABASE_POOL_RECYCLE(self):
+        return self.__properties['DATABASE_POOL_RECYCLE']
+
+    @show_func_name
+    def __init_database_pool_recycle(self):
+        recycle = int(self.CONFIG.get('database', dict()).get('pool_recycle', 1800))
+        log.debug(f'DATABASE_POOL_RECYCLE: {recycle}')
+        return recycle
+
+    @property
+    def DATABASE_POOL_PRE_PING(self):
+        return self.__properties['DATABASE_POOL_PRE_PING']
+
+    @show_func_name
+    def __init_database_pool_pre_ping(self):
+        pre_ping = bool(self.CONFIG.get('database', dict()).get('pool_pre_ping', True))
+        log.debug(f'DATABASE_POOL_PRE_PING: {pre_ping}')
+        return pre_ping
+
+    @property
+    def DATABASE_STATEMENT_TIMEOUT(self):
+        return self.__properties['DATABASE_STATEMENT_TIMEOUT']
+
+    @show_func_name
+    def __init_database_statement_timeout(self):
+        # milliseconds, 0 disables the timeout
+        timeout = int(self.CONFIG.get('database', dict()).get('statement_timeout', 0))
+        log.debug(f'DATABASE_STATEMENT_TIMEOUT: {timeout}')
+        return timeout
+
+    @property
+    def SQL_PROFILE_ENABLED(self):
+        return self.__properties['SQL_PROFILE_ENABLED']
+
+    @show_func_name
+    def __init_sql_profile_enabled(self):
+        enabled = bool(self.CONFIG.get('sql_profile', dict()).get('enabled', True))
+        log.debug(f'SQL_PROFILE_ENABLED: {enabled}')
+        return enabled
+
+    @property
+    def SQL_PROFILE_HEADER(self):
+        return self.__properties['SQL_PROFILE_HEADER']
+
+    @show_func_name
+    def __init_sql_profile_header(self):
+        header = bool(self.CONFIG.get('sql_profile', dict()).get('header', False))
+        log.debug(f'SQL_PROFILE_HEADER: {header}')
+        return header
+
+    @property
+    def SQL_PROFILE_SLOW_REQUEST(self):
+        return self.__properties['SQL_PROFILE_SLOW_REQUEST']
+
+    @show_func_name
+    def __init_sql_profile_slow_request(self):
+        # milliseconds of DB time after which a request is logged with EXPLAIN plans
+        slow_request = float(self.CONFIG.get('sql_profile', dict()).get('slow_request', 500))
+        log.debug(f'SQL_PROFILE_SLOW_REQUEST: {slow_request}')
+        return slow_request
+
+    @property
+    def SQL_PROFILE_N_PLUS_ONE(self):
+        return self.__properties['SQL_PROFILE_N_PLUS_ONE']
+
+    @show_func_name
+    def __init_sql_profile_n_plus_one(self):
+        threshold = int(self.CONFIG.get('sql_profile', dict()).get('n_plus_one', 5))
+        log.debug(f'SQL_PROFILE_N_PLUS_ONE: {threshold}')
+        return threshold
+
+    @property
+    def SQL_PROFILE_TOP(self):
+        return self.__properties['SQL_PROFILE_TOP']
+
+    @show_func_name
+    def __init_sql_profile_top(self):
+        top = int(self.CONFIG.get('sql_profile', dict()).get('top', 3))
+        log.debug(f'SQL_PROFILE_TOP: {top}')
+        return top
+
+    @property
+    def GUNICORN_WORKERS(self):
+        return self.__properties['GUNICORN_WORKERS']
+
+    @show_func_name
+    def __init_gunicorn_workers(self):
+        workers = os.environ.get('WEB_CONCURRENCY')
+        if not workers:
+            workers = self.CONFIG.get('gunicorn', dict()).get('workers', 2)
+        workers = int(workers)
+        log.debug(f'GUNICORN_WORKERS: {workers}')
+        return workers
+
+    @property
+    def GUNICORN_WORKER_CLASS(self):
+        return self.__properties['GUNICORN_WORKER_CLASS']
+
+    @show_func_name
+    def __init_gunicorn_worker_class(self):
+        worker_class = os.environ.get('GUNICORN_WORKER_CLASS')
+        if not worker_class:
+            worker_class = str(self.CONFIG.get('gunicorn', dict()).get('worker_class', 'sync'))
+        log.debug(f'GUNICORN_WORKER_CLASS: {worker_class}')
+        return worker_class
+
+    @property
+    def GUNICORN_THREADS(self):
+        return self.__properties['GUNICORN_THREADS']
+
+    @show_func_name
+    def __init_gunicorn_threads(self):
+        threads = os.environ.get('GUNICORN_THREADS')
+        if not threads:
+            threads = self.CONFIG.get('gunicorn', dict()).get('threads', 1)
+        threads = int(threads)
+        log.debug(f'GUNICORN_THREADS: {threads}')
+        return threads
+
+    @property
+    def GUNICORN_TIMEOUT(self):
+        return self.__properties['GUNICORN_TIMEOUT']
+
+    @show_func_name
+    def __init_gunicorn_timeout(self):
+        timeout = int(self.CONFIG.get('gunicorn', dict()).get('timeout', 30))
+        log.debug(f'GUNICORN_TIMEOUT: {timeout}')
+        return timeout
+
+    @property
+    def GUNICORN_PRELOAD(self):
+        return self.__properties['GUNICORN_PRELOAD']
+
+    @show_func_name
+    def __init_gunicorn_preload(self):
+        preload = os.environ.get('GUNICORN_PRELOAD')
+        if preload:
+            preload = preload.lower() in ('1', 'true', 'yes')
+        else:
+            preload = bool(self.CONFIG.get('gunicorn', dict()).get('preload', True))
+        log.debug(f'GUNICORN_PRELOAD: {preload}')
+        return preload
+
+    @property
+    def GUNICORN_MAX_REQUESTS(self):
+        return self.__properties['GUNICORN_MAX_REQUESTS']
+
+    @show_func_name
+    def __init_gunicorn_max_requests(self):
+        max_requests = int(self.CONFIG.get('gunicorn', dict()).get('max_requests', 0))
+        log.debug(f'GUNICORN_MAX_REQUESTS: {max_requests}')
+        return max_requests
+
+    @property
+    def GUNICORN_MAX_REQUESTS_JITTER(self):
+        return self.__properties['GUNICORN_MAX_REQUESTS_JITTER']
+
+    @show_func_name
+    def __init_gunicorn_max_requests_jitter(self):
+        jitter = int(self.CONFIG.get('gunicorn', dict()).get('max_requests_jitter', 0))
+        log.debug(f'GUNICORN_MAX_REQUESTS_JITTER: {jitter}')
+        return jitter
+
+    @property
+    def AUTH0_USERINFO_URLS(self):
+        return self.__properties['AUTH0_USERINFO_URLS']
+
+    @show_func_name
+    def __init_auth0_userinfo_urls(self):
+        """
+        Token audiences fetched as userinfo besides the https ones, from
+        USERINFO_URLS='url1,url2' or config.yaml
+        """
+        env_urls = os.environ.get('USERINFO_URLS')
+        if env_urls:
+            urls = [url.strip() for url in env_urls.split(',') if url.strip()]
+        else:
+            urls = list(self.CONFIG.get('auth0', dict()).get('userinfo_urls', None) or [])
+        log.debug(f'AUTH0_USERINFO_URLS: {urls}')
+        return tuple(urls)
+
+
+# every SetupConfig property, in definition order
+SETUP_FIELDS = tuple(name for name, value in vars(SetupConfig).items() if isinstance(value, property))
+SNAPSHOT_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.realpath(__file__)))),
+                             '.setup-snapshot.json')
+
+
+class FrozenSetupConfig(object):
+    """Immutable, slotted copy of every SetupConfig property.
+
+    Mappings are read-only and lists become tuples, so a single instance can
+    be shared by the app (and forked workers) without copying.
+    """
+    __slots__ = SETUP_FIELDS
+
+    def __init__(self, values):
+        for name in SETUP_FIELDS:
+            object.__setattr__(self, name, _freeze(values[name]))
+
+    @classmethod
+    def from_setup(cls, setup):
+        return cls(_setup_values(setup))
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f'{type(self).__name__} is read-only')
+
+    def __delattr__(self, name):
+        raise AttributeError(f'{type(self).__name__} is read-only')
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+
+def load_setup(config_yaml=None, snapshot=None):
+    """
+    Returns the FrozenSetupConfig for `config_yaml`.
+
+    In snapshot mode (SETUP_SNAPSHOT=1 unless `snapshot` is given) resolved
+    values are cached in SNAPSHOT_PATH and reused while config.yaml,
+    db-info.yaml, this module and the environment are unchanged, skipping
+    yaml parsing and every property initializer.
+    """
+    if snapshot is None:
+        snapshot = os.environ.get('SETUP_SNAPSHOT', '').lower() in ('1', 'true', 'yes')
+    if not snapshot:
+        return FrozenSetupConfig.from_setup(SetupConfig(config_yaml=config_yaml))
+    key = _snapshot_key(config_yaml)
+    values = _read_snapshot(key)
+    if values is None:
+        values = _setup_values(SetupConfig(config_yaml=config_yaml))
+        _write_snapshot(key, values)
+    elif values['ROOT'] not in sys.path:
+        # SetupConfig.__init_root side effect
+        sys.path.append(values['ROOT'])
+    return FrozenSetupConfig(values)
+
+
+########################################
+# Internal methods; Do not use directly
+########################################
+def _setup_values(setup):
+    return {name: getattr(setup, name) for name in SETUP_FIELDS}
+
+
+def _freeze(value):
+    if isinstance(value, dict):
+        return MappingProxyType({key: _freeze(item) for key, item in value.items()})
+    if isinstance(value, list):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+
+def _snapshot_key(config_yaml):
+    root = os.path.dirname(SNAPSHOT_PATH)
+    sources = [config_yaml or os.path.join(root, 'config.yaml'), os.path.join(root, 'db-info.yaml'), __file__]
+    mtimes = [[path, os.stat(path).st_mtime_ns if os.path.isfile(path) else None] for path in sources]
+    data = json.dumps([mtimes, sorted(os.environ.items())])
+    return sha256(data.encode('utf-8')).hexdigest()
+
+
+def _read_snapshot(key):
+    try:
+        with open(SNAPSHOT_PATH) as snapshot_file:
+            snapshot = json.load(snapshot_file)
+    except (OSError, ValueError):
+        return None
+    if snapshot.get('key') != key or set(snapshot.get('values', ())) != set(SETUP_FIELDS):
+        return None
+    log.debug(f'SNAPSHOT: loaded {SNAPSHOT_PATH}')
+    return snapshot['values']
+
+
+def _write_snapshot(key, values):
+    # holds secrets: owner read/write only, write then rename so readers never see a partial file
+    temp_path = f'{SNAPSHOT_PATH}.{os.getpid()}'
+    try:
+        fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w') as snapshot_file:
+            json.dump({'key': key, 'values': values}, snapshot_file)
+        os.replace(temp_path, SNAPSHOT_PATH)
+    except (OSError, TypeError, ValueError) as e:
+        log.warning(f'SNAPSHOT: not written: {e}')
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
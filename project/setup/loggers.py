@@ -1,16 +1,264 @@
+"""
+Loggers configured from loggers.yaml.
+
+Handlers named in loggers.yaml never run in the calling thread: every
+configured logger gets a NonBlockingQueueHandler instead, and a
+QueueListener thread formats and writes the records. A full queue drops
+records rather than blocking a request. Messages are formatted only on the
+listener thread, so pass %-style args (or LazyJson) instead of building
+strings up front; records with mutable args (dicts, lists, model instances)
+are formatted when logged, so they show the values at call time. RateLimitFilter and SamplingFilter cap high-volume call
+sites and are attached per logger in loggers.yaml.
+"""
+
+import atexit
+import datetime
+import itertools
+import json
 import logging
-from logging.config import dictConfig
+import numbers
 import os
+import threading
+import time
+import uuid
+from logging.config import dictConfig
+from logging.handlers import QueueHandler, QueueListener
+from queue import Full, Queue
+
 import yaml
 
 
 LOGGER_YAML_FILE_PATH = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'loggers.yaml')
 
 
+class LazyJson(object):
+    """Defers json.dumps of `obj` until the record is actually emitted, on
+    the listener thread; do not mutate `obj` after logging it.
+
+    Usage:
+        log.debug(LazyJson(payload))
+    """
+    __slots__ = ('obj', 'indent')
+
+    def __init__(self, obj, indent=4):
+        self.obj = obj
+        self.indent = indent
+
+    def __str__(self):
+        return json.dumps(self.obj, indent=self.indent, default=str)
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """QueueHandler that neither formats nor waits in the calling thread.
+
+    Records are queued with msg and args intact and formatted by the
+    listener's handlers, unless an arg is mutable: those records are
+    formatted before queueing, since the object may change before the
+    listener gets to it. When the queue is full the record is dropped and
+    counted.
+    """
+
+    def __init__(self, queue):
+        super().__init__(queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        args = record.args or ()
+        if isinstance(args, dict):
+            # a single mapping arg (`%(name)s` style) is itself mutable
+            args = record.args = dict(args)
+            args = args.values()
+        if not (_is_immutable(record.msg) and all(_is_immutable(arg) for arg in args)):
+            record.msg = record.getMessage()
+            record.args = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except Full:
+            self.dropped += 1
+
+
+class Formatter(logging.Formatter):
+    """logging.Formatter that appends the count RateLimitFilter stored on a
+    record for the messages suppressed before it.
+    """
+
+    def format(self, record):
+        message = super().format(record)
+        suppressed = getattr(record, 'suppressed', 0)
+        if suppressed:
+            message = f'{message} [{suppressed} similar messages suppressed]'
+        return message
+
+
+class RateLimitFilter(logging.Filter):
+    """Token bucket per call site: `burst` records at once, then `rate` per
+    second. The next record let through carries the number suppressed before
+    it as `record.suppressed`, rendered by Formatter on the listener thread.
+    """
+
+    def __init__(self, rate=10.0, burst=50):
+        super().__init__()
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self._buckets = dict()  # call site => [tokens, updated at, suppressed]
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        key = (record.name, record.pathname, record.lineno)
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = [self.burst, now, 0]
+            tokens = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+            if tokens < 1:
+                bucket[0] = tokens
+                bucket[2] += 1
+                return False
+            bucket[0] = tokens - 1
+            suppressed, bucket[2] = bucket[2], 0
+        record.suppressed = suppressed
+        return True
+
+    def after_fork(self):
+        self._lock = threading.Lock()
+        self._buckets = dict()
+
+
+class SamplingFilter(logging.Filter):
+    """Keeps 1 in `every` records at or below `level` per call site; records
+    above `level` always pass.
+    """
+
+    def __init__(self, every=10, level='DEBUG'):
+        super().__init__()
+        self.every = max(int(every), 1)
+        self.level = level if isinstance(level, int) else logging.getLevelName(level)
+        self._counters = dict()  # call site => itertools.count
+
+    def filter(self, record):
+        if record.levelno > self.level or self.every == 1:
+            return True
+        key = (record.name, record.pathname, record.lineno)
+        counter = self._counters.get(key)
+        if counter is None:
+            counter = self._counters.setdefault(key, itertools.count())
+        return next(counter) % self.every == 0
+
+
+class LogPipeline(object):
+    """Moves the handlers of configured loggers behind queues.
+
+    Loggers sharing the same handlers share one queue and listener thread.
+
+    Usage:
+        log_pipeline.install(config)   # the parsed loggers.yaml
+        log_pipeline.after_fork()      # in a forked worker
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.capacity = 10000
+        self._loggers = list()
+        self._routes = list()  # [(NonBlockingQueueHandler, target handlers, QueueListener)]
+
+    def install(self, config):
+        config = dict(config)
+        queue_config = config.pop('queue', None) or dict()
+        for section in ('formatters', 'filters'):
+            config[section] = _resolve_factories(config.get(section, dict()))
+        dictConfig(config)
+        self.enabled = bool(queue_config.get('enabled', True))
+        self.capacity = int(queue_config.get('capacity', self.capacity))
+        if not self.enabled:
+            return
+        self._loggers = [logging.getLogger(name) for name in config.get('loggers', dict())]
+        if 'root' in config:
+            self._loggers.append(logging.getLogger())
+        routes = dict()
+        for logger in self._loggers:
+            targets = tuple(logger.handlers)
+            if not targets:
+                continue
+            if targets not in routes:
+                routes[targets] = NonBlockingQueueHandler(Queue(self.capacity))
+            logger.handlers = [routes[targets]]
+        self._routes = [(handler, targets, self._start(handler, targets)) for targets, handler in routes.items()]
+
+    def stop(self):
+        """Flush and stop every listener; safe to call more than once."""
+        routes, self._routes = self._routes, list()
+        for handler, targets, listener in routes:
+            listener.stop()
+
+    def after_fork(self):
+        """The listener threads and queue locks of the parent do not survive a
+        fork; give every handler a new queue and listener.
+        """
+        routes = list()
+        for handler, targets, listener in self._routes:
+            handler.queue = Queue(self.capacity)
+            routes.append((handler, targets, self._start(handler, targets)))
+        self._routes = routes
+        for logger in self._loggers:
+            for log_filter in logger.filters:
+                if hasattr(log_filter, 'after_fork'):
+                    log_filter.after_fork()
+
+    @property
+    def stats(self):
+        return {
+            'enabled': self.enabled,
+            'queued': sum(handler.queue.qsize() for handler, targets, listener in self._routes),
+            'capacity': self.capacity,
+            'dropped': sum(handler.dropped for handler, targets, listener in self._routes),
+        }
+
+    ########################################
+    # Internal methods; Do not use directly
+    ########################################
+    @staticmethod
+    def _start(handler, targets):
+        listener = QueueListener(handler.queue, *targets, respect_handler_level=True)
+        listener.start()
+        return listener
+
+
+# types safe to format on the listener thread, see NonBlockingQueueHandler.prepare
+_IMMUTABLE_TYPES = (str, bytes, numbers.Number, type(None), BaseException, LazyJson,
+                    datetime.date, datetime.time, datetime.timedelta, uuid.UUID)
+
+
+def _is_immutable(value):
+    if isinstance(value, (tuple, frozenset)):
+        return all(_is_immutable(item) for item in value)
+    return isinstance(value, _IMMUTABLE_TYPES)
+
+
+def _resolve_factories(section):
+    # dictConfig imports `()` factories by dotted path, which fails for this
+    # module while the project package is still importing it
+    resolved = dict()
+    for name, item_config in section.items():
+        item_config = dict(item_config)
+        factory = item_config.get('()')
+        if isinstance(factory, str) and factory.startswith(__name__ + '.'):
+            item_config['()'] = globals()[factory[len(__name__) + 1:]]
+        resolved[name] = item_config
+    return resolved
+
+
+log_pipeline = LogPipeline()
+
+
 def init_loggers():
     with open(LOGGER_YAML_FILE_PATH) as f:
-        data = yaml.load(f, Loader=yaml.FullLoader)
-        dictConfig(data)
+        data = yaml.load(f, Loader=getattr(yaml, 'CSafeLoader', yaml.SafeLoader))
+        log_pipeline.install(data)
 
 
 class LoggerMetaProperty:
@@ -39,3 +287,4 @@ class LOGGERS(LoggerMetaProperty, metaclass=LoggerProperties):
 
 
 init_loggers()
+atexit.register(log_pipeline.stop)
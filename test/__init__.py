@@ -0,0 +1,8 @@
+import os
+import tempfile
+
+# importing any project module creates the app (project/__init__.py), which
+# needs a database url and a secret key
+TEST_DIR = tempfile.mkdtemp(prefix='project-test-')
+os.environ.setdefault('DATABASE_URL', f"sqlite:///{os.path.join(TEST_DIR, 'primary.db')}")
+os.environ.setdefault('SECRET_KEY', 'secret-key-for-testing')
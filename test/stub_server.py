@@ -0,0 +1,92 @@
+"""
+Local HTTP server standing in for Auth0 in tests.
+
+Usage:
+    with StubServer({'/userinfo': {'nickname': 'stub'}}, delay=0.2) as stub:
+        client.get_json(stub.url('/userinfo'))
+"""
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StubServer(object):
+    """Serves `routes` (path => json body, or (status, json body)) after
+    `delay` seconds, counting requests, the peak of concurrent ones and the
+    client connections they arrived on.
+    """
+
+    def __init__(self, routes=None, delay=0.0):
+        self.routes = dict(routes or dict())
+        self.delay = delay
+        self.requests = 0
+        self.active = 0
+        self.peak = 0
+        self.connections = set()
+        self._lock = threading.Lock()
+        self._server = None
+
+    def url(self, path):
+        return f'http://127.0.0.1:{self._server.server_address[1]}{path}'
+
+    def start(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'  # keep-alive
+
+            def do_GET(self):
+                stub._enter(self.client_address)
+                try:
+                    time.sleep(stub.delay)
+                    status, body = stub._response(self.path)
+                    data = json.dumps(body).encode('utf-8')
+                    self.send_response(status)
+                    self.send_header('Content-Type', 'application/json')
+                    self.send_header('Content-Length', str(len(data)))
+                    self.end_headers()
+                    self.wfile.write(data)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+                finally:
+                    stub._leave()
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name='stub-server', daemon=True).start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    ########################################
+    # Internal methods; Do not use directly
+    ########################################
+    def _response(self, path):
+        response = self.routes.get(path.split('?')[0], (404, {'message': 'not found'}))
+        if isinstance(response, tuple):
+            return response
+        return 200, response
+
+    def _enter(self, client_address):
+        with self._lock:
+            self.connections.add(client_address)
+            self.requests += 1
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+
+    def _leave(self):
+        with self._lock:
+            self.active -= 1
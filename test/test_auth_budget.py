@@ -0,0 +1,63 @@
+import time
+import unittest
+
+from flask import g
+
+from project import auth
+from project.auth import AuthContext, userinfo_seen, userinfo_synced, verify_user
+from project.db import db
+from project.models.user import UserProfile
+from project.runner import app
+from test.stub_server import StubServer
+
+
+class UserinfoBudgetTestCase(unittest.TestCase):
+    """verify_user against a slow local userinfo server: the stored profile is
+    served whenever the latency budget cannot cover the fetch.
+    """
+
+    def setUp(self):
+        self.ctx = app.test_request_context()
+        self.ctx.push()
+        db.create_all()
+        self.userinfo_urls = auth._userinfo_urls
+        # the stub speaks plain http
+        auth._userinfo_urls = list
+
+    def tearDown(self):
+        auth._userinfo_urls = self.userinfo_urls
+        UserProfile.bulk_delete(UserProfile.alternate_id.startswith('stub|'))
+        db.session.remove()
+        self.ctx.pop()
+
+    def verify(self, sub, url, budget):
+        userinfo_synced.pop(sub)
+        userinfo_seen.pop(sub)
+        g.auth_context = AuthContext(budget)
+        start = time.perf_counter()
+        profile = verify_user({'sub': sub, 'aud': [url], 'token': 'stub-token'})
+        return profile, time.perf_counter() - start
+
+    def test_fetch_within_budget(self):
+        with StubServer({'/userinfo': {'nickname': 'fetched'}}, delay=0.05) as stub:
+            profile, elapsed = self.verify('stub|fast', stub.url('/userinfo'), budget=2.0)
+        self.assertEqual(profile.nickname, 'fetched')
+        self.assertEqual(stub.requests, 1)
+
+    def test_slow_fetch_serves_stored_profile(self):
+        with StubServer({'/userinfo': {'nickname': 'too late'}}, delay=1.0) as stub:
+            profile, elapsed = self.verify('stub|slow', stub.url('/userinfo'), budget=0.2)
+        self.assertEqual(profile.alternate_id, 'stub|slow')
+        self.assertIsNone(profile.nickname)
+        self.assertLess(elapsed, 0.8)
+
+    def test_spent_budget_serves_stored_profile(self):
+        with StubServer({'/userinfo': {'nickname': 'never'}}) as stub:
+            profile, elapsed = self.verify('stub|spent', stub.url('/userinfo'), budget=0.0)
+        self.assertEqual(profile.alternate_id, 'stub|spent')
+        self.assertIsNone(profile.nickname)
+        self.assertEqual(stub.requests, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,35 @@
+import os
+import subprocess
+import sys
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+
+# loads gunicorn.conf.py the way the gunicorn master does, then reports
+# whether the project package (and so create_app) was imported
+MASTER = """
+import sys
+from gunicorn.app.wsgiapp import WSGIApplication
+sys.argv = ['gunicorn', '-c', 'gunicorn.conf.py', 'project:app']
+application = WSGIApplication()
+print(application.cfg.preload_app, application.cfg.threads,
+      any(name == 'project' or name.startswith('project.') for name in sys.modules))
+"""
+
+
+class GunicornConfTestCase(unittest.TestCase):
+
+    def master(self, **env):
+        result = subprocess.run([sys.executable, '-c', MASTER], cwd=ROOT, check=True,
+                                stdout=subprocess.PIPE, env=dict(os.environ, **env))
+        return result.stdout.decode().split()
+
+    def test_settings_from_environment(self):
+        self.assertEqual(self.master(GUNICORN_PRELOAD='true', GUNICORN_THREADS='4'), ['True', '4', 'False'])
+
+    def test_no_preload_keeps_the_app_out_of_the_master(self):
+        self.assertEqual(self.master(GUNICORN_PRELOAD='false', GUNICORN_THREADS='1'), ['False', '1', 'False'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+import time
+import unittest
+
+from jose import jwt
+
+from project.auth import AuthError, jwks_store, verify_decode_jwt
+from project.lib.http_client import HttpClient, HttpError
+from project.runner import app
+from test.stub_server import StubServer
+
+
+class HttpClientTestCase(unittest.TestCase):
+    """HttpClient against a local stub server."""
+
+    def setUp(self):
+        self.client = HttpClient(connect_timeout=1.0, read_timeout=1.0, pool_size=4, breaker_threshold=2)
+
+    def tearDown(self):
+        self.client.close()
+
+    def test_get_json(self):
+        with StubServer({'/userinfo': {'nickname': 'stub'}}) as stub:
+            self.assertEqual(self.client.get_json(stub.url('/userinfo')), {'nickname': 'stub'})
+
+    def test_keep_alive_reuses_one_connection(self):
+        with StubServer({'/userinfo': {'nickname': 'stub'}}) as stub:
+            for _ in range(5):
+                self.client.get_json(stub.url('/userinfo'))
+            self.assertEqual(stub.requests, 5)
+            self.assertEqual(len(stub.connections), 1)
+
+    def test_read_timeout(self):
+        with StubServer({'/slow': {}}, delay=0.5) as stub:
+            start = time.perf_counter()
+            with self.assertRaises(HttpError) as raised:
+                self.client.get_json(stub.url('/slow'), timeout=(1.0, 0.1))
+            self.assertLess(time.perf_counter() - start, 0.45)
+            self.assertIsNone(raised.exception.status_code)
+
+    def test_status_code(self):
+        with StubServer({'/forbidden': (403, {'message': 'no'})}) as stub:
+            with self.assertRaises(HttpError) as raised:
+                self.client.get_json(stub.url('/forbidden'))
+            self.assertEqual(raised.exception.status_code, 403)
+
+    def test_get_json_many_runs_concurrently(self):
+        routes = {f'/info/{i}': {'i': i} for i in range(4)}
+        with StubServer(routes, delay=0.2) as stub:
+            urls = [stub.url(path) for path in routes]
+            start = time.perf_counter()
+            results = self.client.get_json_many(urls)
+            elapsed = time.perf_counter() - start
+            self.assertEqual(list(results), urls)
+            self.assertEqual([result['i'] for result in results.values()], [0, 1, 2, 3])
+            self.assertEqual(stub.peak, 4)
+            self.assertLess(elapsed, 0.6)
+
+    def test_breaker_opens_on_server_errors(self):
+        with StubServer({'/down': (500, {'message': 'down'})}) as stub:
+            for _ in range(2):
+                with self.assertRaises(HttpError):
+                    self.client.get_json(stub.url('/down'))
+            with self.assertRaises(HttpError) as raised:
+                self.client.get_json(stub.url('/down'))
+            self.assertIn('circuit', raised.exception.message)
+            self.assertEqual(stub.requests, 2)
+
+
+class JwksUnavailableTestCase(unittest.TestCase):
+    """An unreachable key set surfaces as a 503 AuthError."""
+
+    def setUp(self):
+        self.url, self.testing = jwks_store.url, app.testing
+        jwks_store.clear()
+        jwks_store.client.close()
+        app.testing = False
+
+    def tearDown(self):
+        jwks_store.url, app.testing = self.url, self.testing
+        jwks_store.stop()
+        jwks_store.clear()
+
+    def test_jwks_failure_is_503(self):
+        token = jwt.encode({'sub': 'stub|1', 'iss': 'https://stub/'}, 'secret', algorithm='HS256',
+                           headers={'kid': 'unknown'})
+        with StubServer({'/.well-known/jwks.json': (502, {'message': 'bad gateway'})}) as stub:
+            jwks_store.url = stub.url('/.well-known/jwks.json')
+            with app.test_request_context():
+                with self.assertRaises(AuthError) as raised:
+                    verify_decode_jwt(token)
+        self.assertEqual(raised.exception.status_code, 503)
+
+
+if __name__ == '__main__':
+    unittest.main()
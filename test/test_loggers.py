@@ -0,0 +1,53 @@
+import logging
+import unittest
+from queue import Queue
+
+from project.setup.loggers import LazyJson, NonBlockingQueueHandler
+
+
+class NonBlockingQueueHandlerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.handler = NonBlockingQueueHandler(Queue())
+        self.log = logging.getLogger('test.loggers')
+        self.log.propagate = False
+        self.log.setLevel(logging.DEBUG)
+        self.log.addHandler(self.handler)
+
+    def tearDown(self):
+        self.log.removeHandler(self.handler)
+
+    def queued(self):
+        return self.handler.queue.get_nowait()
+
+    def test_immutable_args_are_formatted_later(self):
+        payload = LazyJson({'a': 1})
+        self.log.debug('%s took %.1fms: %s', 'GET /', 12.5, payload)
+        record = self.queued()
+        self.assertEqual(record.args, ('GET /', 12.5, payload))
+        self.assertEqual(record.getMessage(), 'GET / took 12.5ms: {\n    "a": 1\n}')
+
+    def test_mutable_args_are_formatted_at_call_time(self):
+        options = {'connect_args': {'options': '-c statement_timeout=100'}}
+        self.log.debug('%s engine options: %s', 'replica_0', options)
+        options['connect_args']['options'] = ''
+        record = self.queued()
+        self.assertIsNone(record.args)
+        self.assertEqual(record.getMessage(),
+                         "replica_0 engine options: {'connect_args': {'options': '-c statement_timeout=100'}}")
+
+    def test_mapping_args_are_copied(self):
+        values = {'path': '/', 'ms': 3}
+        self.log.debug('%(path)s in %(ms)dms', values)
+        values['ms'] = 30
+        self.assertEqual(self.queued().getMessage(), '/ in 3ms')
+
+    def test_mutable_msg_is_formatted_at_call_time(self):
+        rows = [1]
+        self.log.debug(rows)
+        rows.append(2)
+        self.assertEqual(self.queued().getMessage(), '[1]')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+import unittest
+from unittest import mock
+
+from project.db import db
+from project.models.mixins.query import _MAX_BIND_PARAMS
+from project.models.user import UserProfile
+from project.runner import app
+
+
+class GetManyTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.ctx = app.app_context()
+        self.ctx.push()
+        db.create_all()
+        self.profiles = [UserProfile(alternate_id=f'get-many|{n}') for n in range(3)]
+        db.session.add_all(self.profiles)
+        db.session.commit()
+        self.ids = [profile.id for profile in self.profiles]
+        db.session.remove()
+
+    def tearDown(self):
+        db.session.remove()
+        UserProfile.query.filter(UserProfile.alternate_id.startswith('get-many|')).delete(synchronize_session=False)
+        db.session.commit()
+        self.ctx.pop()
+
+    def alternate_ids(self, profiles):
+        return [profile and profile.alternate_id for profile in profiles]
+
+    def test_int_ids(self):
+        self.assertEqual(self.alternate_ids(UserProfile.get_many(self.ids[::-1])),
+                         [f'get-many|{n}' for n in (2, 1, 0)])
+
+    def test_string_ids(self):
+        ids = [str(id) for id in self.ids]
+        self.assertEqual(self.alternate_ids(UserProfile.get_many(ids)),
+                         [f'get-many|{n}' for n in range(3)])
+
+    def test_string_ids_from_identity_map(self):
+        profile = UserProfile.query.get(self.ids[0])
+        self.assertIs(UserProfile.get_many([str(self.ids[0])])[0], profile)
+
+    def test_missing_and_invalid_ids(self):
+        self.assertEqual(UserProfile.get_many([max(self.ids) + 100, 'not-an-id', self.ids[1]])[:2], [None, None])
+
+
+class BulkUpsertTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.ctx = app.app_context()
+        self.ctx.push()
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        UserProfile.bulk_delete(UserProfile.alternate_id.startswith('upsert|'))
+        self.ctx.pop()
+
+    def rows(self, count, **values):
+        return [dict(alternate_id=f'upsert|{n}', **values) for n in range(count)]
+
+    def test_chunks_stay_under_the_bind_parameter_limit(self):
+        # every row binds its column defaults too, not just alternate_id
+        execute = db.session.execute
+        params = list()
+
+        def spy(statement, *args, **kwargs):
+            params.append(len(statement.compile(dialect=db.engine.dialect).params))
+            return execute(statement, *args, **kwargs)
+
+        with mock.patch.object(db.session, 'execute', spy):
+            self.assertEqual(UserProfile.bulk_upsert(self.rows(1500), key='alternate_id'), 1500)
+        self.assertGreater(len(params), 1)
+        self.assertLessEqual(max(params), _MAX_BIND_PARAMS[db.engine.dialect.name])
+
+    def test_counts(self):
+        self.assertEqual(UserProfile.bulk_upsert(self.rows(10), key='alternate_id'), 10)
+        self.assertEqual(UserProfile.bulk_upsert(self.rows(15), key='alternate_id', update=[]), 5)
+        self.assertEqual(UserProfile.bulk_upsert(self.rows(20, locale='en'), key='alternate_id'), 20)
+
+    def test_per_row_fallback_counts(self):
+        self.assertEqual(UserProfile._bulk_upsert_rows(self.rows(10), 'alternate_id', []), 10)
+        self.assertEqual(UserProfile._bulk_upsert_rows(self.rows(15), 'alternate_id', []), 5)
+        self.assertEqual(UserProfile._bulk_upsert_rows(self.rows(20, locale='en'), 'alternate_id', ['locale']), 20)
+        self.assertEqual(UserProfile.query.filter(UserProfile.alternate_id.startswith('upsert|'), UserProfile.locale == 'en').count(), 20)
+        self.assertEqual(UserProfile.query.filter_by(alternate_id='upsert|0').one().version, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+import os
+import unittest
+
+from sqlalchemy.engine import make_url
+
+from project.db import db, use_primary
+from project.lib.pool import InstrumentedQueuePool
+from project.models.user import UserProfile
+from project.runner import app
+from test import TEST_DIR
+
+
+class ReadReplicaRoutingTestCase(unittest.TestCase):
+    """RoutingSession against two SQLite files, a primary and a replica that
+    each hold a row the other lacks.
+    """
+
+    def setUp(self):
+        self.binds = app.config.get('SQLALCHEMY_BINDS'), app.config.get('DATABASE_REPLICA_BINDS')
+        app.config['SQLALCHEMY_BINDS'] = {'replica_0': f"sqlite:///{os.path.join(TEST_DIR, 'replica.db')}"}
+        app.config['DATABASE_REPLICA_BINDS'] = ['replica_0']
+        self.ctx = app.app_context()
+        self.ctx.push()
+        db.create_all()
+        self.replica = db.get_engine(app, bind='replica_0')
+        UserProfile.__table__.create(self.replica, checkfirst=True)
+        with db.engine.begin() as connection:
+            connection.execute(UserProfile.__table__.insert(), {'alternate_id': 'replica|on-primary'})
+        with self.replica.begin() as connection:
+            connection.execute(UserProfile.__table__.insert(), {'alternate_id': 'replica|on-replica'})
+
+    def tearDown(self):
+        db.session.remove()
+        for engine in (db.engine, self.replica):
+            with engine.begin() as connection:
+                connection.execute(UserProfile.__table__.delete()
+                                   .where(UserProfile.alternate_id.startswith('replica|')))
+        self.replica.dispose()
+        app.extensions['sqlalchemy'].connectors.pop('replica_0', None)
+        app.config['SQLALCHEMY_BINDS'], app.config['DATABASE_REPLICA_BINDS'] = self.binds
+        self.ctx.pop()
+
+    def reads_replica(self):
+        on_replica = UserProfile.exists(alternate_id='replica|on-replica')
+        on_primary = UserProfile.exists(alternate_id='replica|on-primary')
+        self.assertNotEqual(on_replica, on_primary)
+        return on_replica
+
+    def test_reads_go_to_the_replica(self):
+        self.assertTrue(self.reads_replica())
+
+    def test_plain_queries_stay_on_the_primary(self):
+        self.assertIsNotNone(UserProfile.query.filter_by(alternate_id='replica|on-primary').first())
+
+    def test_primary_after_flush(self):
+        self.assertTrue(self.reads_replica())
+        UserProfile(alternate_id='replica|written').save()
+        self.assertFalse(self.reads_replica())
+
+    def test_primary_after_use_primary(self):
+        use_primary()
+        self.assertFalse(self.reads_replica())
+
+    def test_new_session_reads_the_replica_again(self):
+        use_primary()
+        self.assertFalse(self.reads_replica())
+        db.session.remove()
+        self.assertTrue(self.reads_replica())
+
+
+class EngineOptionsPerBindTestCase(unittest.TestCase):
+    """Each bind gets the engine options of its own URL, not the primary's."""
+
+    def options(self, url):
+        sa_url, options = db.apply_driver_hacks(app, make_url(url), dict())
+        return options
+
+    def test_postgres_bind(self):
+        options = self.options('postgresql://user@replica/project')
+        self.assertIs(options['poolclass'], InstrumentedQueuePool)
+        self.assertEqual(options['pool_size'], app.config['SETUP'].DATABASE_POOL_SIZE)
+
+    def test_sqlite_bind(self):
+        options = self.options(f"sqlite:///{os.path.join(TEST_DIR, 'replica.db')}")
+        self.assertIsNot(options.get('poolclass'), InstrumentedQueuePool)
+        self.assertNotIn('pool_size', options)
+        self.assertNotIn('connect_args', options)
+
+    def test_replica_engines(self):
+        binds = app.config.get('SQLALCHEMY_BINDS')
+        app.config['SQLALCHEMY_BINDS'] = {
+            'replica_pg': 'postgresql://user@replica/project',
+            'replica_sqlite': f"sqlite:///{os.path.join(TEST_DIR, 'replica.db')}",
+        }
+        try:
+            with app.app_context():
+                self.assertIsInstance(db.get_engine(app, bind='replica_pg').pool, InstrumentedQueuePool)
+                self.assertNotIsInstance(db.get_engine(app, bind='replica_sqlite').pool, InstrumentedQueuePool)
+        finally:
+            for bind in app.config['SQLALCHEMY_BINDS']:
+                app.extensions['sqlalchemy'].connectors.pop(bind, None)
+            app.config['SQLALCHEMY_BINDS'] = binds
+
+if __name__ == '__main__':
+    unittest.main()
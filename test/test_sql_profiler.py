@@ -0,0 +1,65 @@
+import os
+import unittest
+
+from flask import Flask
+from sqlalchemy import create_engine
+from sqlalchemy.exc import OperationalError
+
+from project.db import sql_profiler
+from test import TEST_DIR
+
+
+class SqlProfilerTestCase(unittest.TestCase):
+    """sql_profiler on a bare Flask app whose statements run on an engine
+    other than the project's primary.
+    """
+
+    def setUp(self):
+        self.slow_request = sql_profiler.slow_request
+        sql_profiler.slow_request = 0
+        self.engine = create_engine(f"sqlite:///{os.path.join(TEST_DIR, 'profiled.db')}")
+        with self.engine.begin() as connection:
+            connection.exec_driver_sql('CREATE TABLE IF NOT EXISTS profiled (id INTEGER PRIMARY KEY)')
+        self.app = Flask(__name__)
+        self.app.after_request(sql_profiler._after_request)
+        self.app.add_url_rule('/select', 'select', self.select)
+        self.app.add_url_rule('/error', 'error', self.error)
+
+    def tearDown(self):
+        sql_profiler.slow_request = self.slow_request
+        self.engine.dispose()
+
+    def select(self):
+        with self.engine.connect() as connection:
+            connection.exec_driver_sql('SELECT id FROM profiled WHERE id = ?', (1,)).fetchall()
+        return 'ok'
+
+    def error(self):
+        with self.engine.connect() as connection:
+            for _ in range(3):
+                with self.assertRaises(OperationalError):
+                    connection.exec_driver_sql('SELECT missing FROM profiled')
+            self.info = dict(connection.info)
+            connection.exec_driver_sql('SELECT id FROM profiled').fetchall()
+        return 'ok'
+
+    def test_explain_runs_after_the_response_on_the_statements_engine(self):
+        self.assertTrue(sql_profiler.enabled)
+        with self.assertLogs('Database', 'DEBUG') as logs:
+            response = self.app.test_client().get('/select')
+            self.assertFalse([line for line in logs.output if 'EXPLAIN' in line])
+            response.close()
+        explained = [line for line in logs.output if 'EXPLAIN' in line]
+        self.assertEqual(len(explained), 1)
+        self.assertIn('profiled', explained[0])
+        self.assertNotIn('EXPLAIN failed', explained[0])
+
+    def test_failed_statements_leave_no_start_times(self):
+        with self.assertLogs('Database', 'DEBUG') as logs:
+            self.app.test_client().get('/error').close()
+        self.assertEqual(self.info, dict())
+        self.assertIn('1 queries', logs.output[0])
+
+
+if __name__ == '__main__':
+    unittest.main()